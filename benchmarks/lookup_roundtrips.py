@@ -0,0 +1,81 @@
+"""
+Database round trips of a primary key lookup in the routers, comparing the old
+check-then-fetch pattern with lookup.get_or_404.
+
+    python -m benchmarks.lookup_roundtrips --samples 200
+
+Ids are sampled from the tables of the configured database, so seed it first.
+"""
+import argparse
+import time
+
+from sqlalchemy import event, select
+
+import dbs_assignment.models as models
+from dbs_assignment.database import engine, SessionLocal
+from dbs_assignment.lookup import get_or_404
+
+MODELS = [
+    models.User, models.Card, models.Author, models.Category,
+    models.Publication, models.Instance, models.Reservation, models.Rental
+]
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def check_then_fetch(db, model, id):
+    # what every GET/PATCH/DELETE handler did before
+    if not db.query(model).filter(model.id == id).first():
+        raise LookupError(id)
+    return db.query(model).filter(model.id == id).first()
+
+
+def primary_key_lookup(db, model, id):
+    return get_or_404(db, model, id, "Not found")
+
+
+def measure(lookup, model, ids, counter):
+    counter.count = 0
+    start = time.perf_counter()
+
+    for id in ids:
+        db = SessionLocal()
+        try:
+            lookup(db, model, id)
+        finally:
+            db.close()
+
+    elapsed = time.perf_counter() - start
+    return counter.count / len(ids), elapsed * 1000 / len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200, help="ids sampled per table")
+    args = parser.parse_args()
+
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+
+    print(f"{'table':<14}{'ids':>6}{'queries before':>16}{'queries after':>15}{'ms before':>11}{'ms after':>10}")
+    for model in MODELS:
+        with engine.connect() as connection:
+            ids = connection.execute(select(model.id).limit(args.samples)).scalars().all()
+        if not ids:
+            print(f"{model.__tablename__:<14}{0:>6}  (empty table, skipped)")
+            continue
+
+        queries_before, ms_before = measure(check_then_fetch, model, ids, counter)
+        queries_after, ms_after = measure(primary_key_lookup, model, ids, counter)
+        print(f"{model.__tablename__:<14}{len(ids):>6}{queries_before:>16.2f}{queries_after:>15.2f}"
+              f"{ms_before:>11.3f}{ms_after:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Load test of every route in dbs_assignment/router.py.
+
+    python -m benchmarks.routes seed --users 10000 --publications 5000 --authors-per-publication 3 --instances-per-publication 4 --queues 500 --queue-length 5
+    python -m benchmarks.routes run --url http://localhost:8000 --requests 200 --concurrency 16 --output before.json
+    python -m benchmarks.routes compare before.json after.json --tolerance 0.15
+
+seed generates the catalogue from --seed and bulk loads it with dbs_assignment.load. Ids are
+derived from the seed, so seeding twice with the same arguments loads nothing new.
+
+run sends --requests requests per route from --concurrency clients over keep-alive
+connections, route by route: creates first, then reads, updates and deletes (which remove
+rows the creates made). Ids are sampled from the configured database. The report holds
+p50/p95/p99 latency, throughput and queries per request of every route as JSON, written to
+--output or stdout. Queries per request come from the X-DB-Queries header, start the server
+with METRICS_QUERY_HEADER=true to get them.
+
+compare prints both runs side by side and exits with status 1 when a route got slower at
+p95 or lost throughput by more than --tolerance, or executes more queries per request.
+"""
+import argparse
+import csv
+import datetime
+import http.client
+import io
+import json
+import math
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+import dbs_assignment.models as models
+from dbs_assignment import load
+from dbs_assignment.database import SessionLocal, engine
+
+TYPES = ["physical", "ebook", "audiobook"]
+# rows sampled per entity for the ids the requests use
+SAMPLE_SIZE = 1000
+# rows per request of the /bulk routes
+BULK_ROWS = 100
+
+
+# Seeding
+
+def seeded_id(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def csv_file(columns: list, rows) -> io.StringIO:
+    file = io.StringIO()
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(rows)
+    file.seek(0)
+    return file
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+
+    users = [seeded_id(rng) for _ in range(args.users)]
+    authors = [seeded_id(rng) for _ in range(args.authors or max(1, args.publications // 2))]
+    categories = [seeded_id(rng) for _ in range(args.categories)]
+    publications = [seeded_id(rng) for _ in range(args.publications)]
+
+    files = {
+        "users": csv_file(
+            ["id", "name", "surname", "email", "birth_date", "personal_identificator"],
+            ((id, "Bench", "User", f"{id.hex}@bench.example", "1990-01-01", id.hex[:10]) for id in users)
+        ),
+        "authors": csv_file(["id", "name", "surname"], ((id, "Bench", id.hex[:12]) for id in authors)),
+        "categories": csv_file(["id", "name"], ((id, f"bench-{id.hex[:12]}") for id in categories)),
+        "publications": csv_file(["id", "title"], ((id, f"Benchmark title {id.hex[:8]}") for id in publications)),
+        "publication_authors": csv_file(["publication_id", "author_id"], (
+            (publication, author)
+            for publication in publications
+            for author in rng.sample(authors, min(args.authors_per_publication, len(authors)))
+        )),
+        "publication_categories": csv_file(["publication_id", "category_id"], (
+            (publication, category)
+            for publication in publications
+            for category in rng.sample(categories, min(2, len(categories)))
+        )),
+        "instances": csv_file(["id", "type", "publisher", "year", "status", "publication_id"], (
+            (seeded_id(rng), rng.choice(TYPES), "Bench", rng.randint(1950, 2023), "available", publication)
+            for publication in publications
+            for _ in range(args.instances_per_publication)
+        )),
+    }
+
+    connection = engine.raw_connection()
+    try:
+        for entity, file in files.items():
+            start = time.perf_counter()
+            staged, inserted = load.load(connection, entity, file, "csv")
+            connection.commit()
+            print(f"{entity}: {inserted} of {staged} rows loaded in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    # reservation queues of --queue-length users on the first --queues publications
+    reservations = [
+        {"id": seeded_id(rng), "user_id": user, "publication_id": publication, "position": position}
+        for publication in publications[:args.queues]
+        for position, user in enumerate(rng.sample(users, min(args.queue_length, len(users))), start=1)
+    ]
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for offset in range(0, len(reservations), 1000):
+            connection.execute(insert(models.Reservation.__table__).on_conflict_do_nothing(), reservations[offset:offset + 1000])
+    print(f"reservations: {len(reservations)} rows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+# Requests
+
+SAMPLED = {
+    "users": (models.User.id,),
+    "cards": (models.Card.id,),
+    "authors": (models.Author.id, models.Author.name, models.Author.surname),
+    "categories": (models.Category.id, models.Category.name),
+    "publications": (models.Publication.id,),
+    "instances": (models.Instance.id,),
+    "reservations": (models.Reservation.id,),
+    "rentals": (models.Rental.id,),
+}
+
+
+class Skip(Exception):
+    pass
+
+
+class Picker:
+    # Chooses the rows requests are sent for. Rows of an entity are sampled from the database the
+    # first time a route needs one, so routes running later see the rows earlier routes created.
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.samples = {}
+        # ids returned by the create routes, used up by the delete routes
+        self.created = defaultdict(list)
+
+    def rows(self, entity: str, count: int = 1) -> list:
+        if entity not in self.samples:
+            with SessionLocal() as db:
+                self.samples[entity] = db.execute(
+                    select(*SAMPLED[entity]).order_by(func.random()).limit(SAMPLE_SIZE)
+                ).all()
+
+        if not self.samples[entity]:
+            raise Skip(f"no {entity} in the database")
+        return self.rng.sample(self.samples[entity], min(count, len(self.samples[entity])))
+
+    def id(self, entity: str) -> str:
+        return str(self.rows(entity)[0].id)
+
+    def take(self, entity: str) -> str:
+        if not self.created[entity]:
+            raise Skip(f"no {entity} left from the create routes")
+        return self.created[entity].pop()
+
+
+def new_user(pick):
+    id = uuid.uuid4()
+    return {"id": str(id), "name": "Bench", "surname": "User", "email": f"{id.hex}@bench.example",
+            "birth_date": "1990-01-01", "personal_identificator": id.hex[:10]}
+
+
+def new_author(pick):
+    return {"name": "Bench", "surname": uuid.uuid4().hex[:12]}
+
+
+def new_category(pick):
+    return {"name": f"bench-{uuid.uuid4().hex[:12]}"}
+
+
+def new_publication(pick):
+    return {
+        "title": f"Benchmark title {uuid.uuid4().hex[:8]}",
+        "authors": [{"name": row.name, "surname": row.surname} for row in pick.rows("authors", 2)],
+        "categories": [row.name for row in pick.rows("categories", 2)],
+    }
+
+
+def new_instance(pick):
+    return {"type": pick.rng.choice(TYPES), "publisher": "Bench", "year": 2020, "status": "available",
+            "publication_id": pick.id("publications")}
+
+
+# (route, entity whose ids its responses return, share of --requests, request builder)
+SCENARIOS = [
+    ("POST /users", "users", 1, lambda pick: ("POST", "/users", new_user(pick))),
+    ("POST /cards", "cards", 1, lambda pick: ("POST", "/cards", {"user_id": pick.id("users"), "magstripe": uuid.uuid4().hex, "status": "active"})),
+    ("POST /authors", "authors", 1, lambda pick: ("POST", "/authors", new_author(pick))),
+    ("POST /categories", "categories", 1, lambda pick: ("POST", "/categories", new_category(pick))),
+    ("POST /publications", "publications", 1, lambda pick: ("POST", "/publications", new_publication(pick))),
+    ("POST /instances", "instances", 1, lambda pick: ("POST", "/instances", new_instance(pick))),
+    ("POST /reservations", "reservations", 1, lambda pick: ("POST", "/reservations", {"user_id": pick.id("users"), "publication_id": pick.id("publications")})),
+    ("POST /rentals", "rentals", 1, lambda pick: ("POST", "/rentals", {"user_id": pick.id("users"), "publication_id": pick.id("publications"), "duration": 7})),
+    ("POST /authors/bulk", None, 0.1, lambda pick: ("POST", "/authors/bulk", [new_author(pick) for _ in range(BULK_ROWS)])),
+    ("POST /categories/bulk", None, 0.1, lambda pick: ("POST", "/categories/bulk", [new_category(pick) for _ in range(BULK_ROWS)])),
+    ("POST /publications/bulk", None, 0.1, lambda pick: ("POST", "/publications/bulk", [new_publication(pick) for _ in range(BULK_ROWS)])),
+    ("POST /instances/bulk", None, 0.1, lambda pick: ("POST", "/instances/bulk", [new_instance(pick) for _ in range(BULK_ROWS)])),
+
+    ("GET /users", None, 1, lambda pick: ("GET", "/users", None)),
+    ("GET /users/{user_id}", None, 1, lambda pick: ("GET", f"/users/{pick.id('users')}", None)),
+    ("GET /cards", None, 1, lambda pick: ("GET", "/cards", None)),
+    ("GET /cards/{card_id}", None, 1, lambda pick: ("GET", f"/cards/{pick.id('cards')}", None)),
+    ("GET /authors", None, 1, lambda pick: ("GET", "/authors", None)),
+    ("GET /authors/{author_id}", None, 1, lambda pick: ("GET", f"/authors/{pick.id('authors')}", None)),
+    ("GET /categories", None, 1, lambda pick: ("GET", "/categories", None)),
+    ("GET /categories/{category_id}", None, 1, lambda pick: ("GET", f"/categories/{pick.id('categories')}", None)),
+    ("GET /publications", None, 1, lambda pick: ("GET", "/publications", None)),
+    ("GET /publications/{publication_id}", None, 1, lambda pick: ("GET", f"/publications/{pick.id('publications')}", None)),
+    ("GET /publications/{publication_id}/availability", None, 1, lambda pick: ("GET", f"/publications/{pick.id('publications')}/availability", None)),
+    ("GET /instances", None, 1, lambda pick: ("GET", "/instances", None)),
+    ("GET /instances/{instance_id}", None, 1, lambda pick: ("GET", f"/instances/{pick.id('instances')}", None)),
+    ("GET /reservations", None, 1, lambda pick: ("GET", "/reservations", None)),
+    ("GET /reservations/{reservation_id}", None, 1, lambda pick: ("GET", f"/reservations/{pick.id('reservations')}", None)),
+    ("GET /reservations/{reservation_id}/position", None, 1, lambda pick: ("GET", f"/reservations/{pick.id('reservations')}/position", None)),
+    ("GET /rentals", None, 1, lambda pick: ("GET", "/rentals", None)),
+    ("GET /rentals/{rental_id}", None, 1, lambda pick: ("GET", f"/rentals/{pick.id('rentals')}", None)),
+    ("GET /export/rentals", None, 0.02, lambda pick: ("GET", "/export/rentals?format=ndjson", None)),
+    ("GET /export/instances", None, 0.02, lambda pick: ("GET", "/export/instances?format=ndjson", None)),
+    ("GET /export/reservations", None, 0.02, lambda pick: ("GET", "/export/reservations?format=csv", None)),
+    ("GET /cache/stats", None, 1, lambda pick: ("GET", "/cache/stats", None)),
+    ("GET /metrics", None, 1, lambda pick: ("GET", "/metrics", None)),
+
+    ("PATCH /users/{user_id}", None, 1, lambda pick: ("PATCH", f"/users/{pick.id('users')}", {"name": "Patched"})),
+    ("PATCH /cards/{card_id}", None, 1, lambda pick: ("PATCH", f"/cards/{pick.id('cards')}", {"status": "inactive"})),
+    ("PATCH /authors/{author_id}", None, 1, lambda pick: ("PATCH", f"/authors/{pick.id('authors')}", {"surname": uuid.uuid4().hex[:12]})),
+    ("PATCH /categories/{category_id}", None, 1, lambda pick: ("PATCH", f"/categories/{pick.id('categories')}", new_category(pick))),
+    ("PATCH /publications/{publication_id}", None, 1, lambda pick: ("PATCH", f"/publications/{pick.id('publications')}", {"title": "Patched title"})),
+    ("PATCH /instances/{instance_id}", None, 1, lambda pick: ("PATCH", f"/instances/{pick.id('instances')}", {"publisher": "Patched"})),
+    ("PATCH /rentals/{rental_id}", None, 1, lambda pick: ("PATCH", f"/rentals/{pick.id('rentals')}", {"duration": 14})),
+
+    ("DELETE /reservations/{reservation_id}", None, 1, lambda pick: ("DELETE", f"/reservations/{pick.take('reservations')}", None)),
+    ("DELETE /cards/{card_id}", None, 1, lambda pick: ("DELETE", f"/cards/{pick.take('cards')}", None)),
+    ("DELETE /instances/{instance_id}", None, 1, lambda pick: ("DELETE", f"/instances/{pick.take('instances')}", None)),
+    ("DELETE /publications/{publication_id}", None, 1, lambda pick: ("DELETE", f"/publications/{pick.take('publications')}", None)),
+    ("DELETE /authors/{author_id}", None, 1, lambda pick: ("DELETE", f"/authors/{pick.take('authors')}", None)),
+    ("DELETE /categories/{category_id}", None, 1, lambda pick: ("DELETE", f"/categories/{pick.take('categories')}", None)),
+]
+
+
+class Client:
+    # one keep-alive connection per client thread
+    def __init__(self, url: str):
+        self.url = urlsplit(url)
+        self.local = threading.local()
+
+    def connection(self, fresh: bool = False) -> http.client.HTTPConnection:
+        if fresh or getattr(self.local, "connection", None) is None:
+            connection_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+            self.local.connection = connection_class(self.url.netloc, timeout=60)
+        return self.local.connection
+
+    def send(self, method: str, path: str, body) -> tuple:
+        # (status, seconds, queries, parsed body)
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"}
+
+        start = time.perf_counter()
+        for attempt in range(2):
+            try:
+                connection = self.connection(fresh=attempt > 0)
+                connection.request(method, self.url.path.rstrip("/") + path, body=data, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed the kept-alive connection, retry once on a new one
+                if attempt:
+                    return 0, time.perf_counter() - start, None, None
+        elapsed = time.perf_counter() - start
+
+        queries = response.getheader("X-DB-Queries")
+        try:
+            parsed = json.loads(content) if response.getheader("Content-Type", "").startswith("application/json") else None
+        except ValueError:
+            parsed = None
+
+        return response.status, elapsed, int(queries) if queries is not None else None, parsed
+
+
+def percentile(values: list, fraction: float) -> float:
+    # nearest rank on sorted values
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(results: list, wall: float) -> dict:
+    latencies = sorted(seconds * 1000 for _, seconds, _, _ in results)
+    queries = [count for _, _, count, _ in results if count is not None]
+
+    return {
+        "requests": len(results),
+        "statuses": dict(sorted(Counter(str(status) for status, _, _, _ in results).items())),
+        "errors": sum(1 for status, _, _, _ in results if status == 0 or status >= 500),
+        "throughput_rps": round(len(results) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "max": round(latencies[-1], 3),
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2),
+            "max": max(queries),
+        } if queries else None,
+    }
+
+
+def run_scenario(client: Client, pick: Picker, entity, requests: list, concurrency: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda request: client.send(*request), requests))
+    wall = time.perf_counter() - start
+
+    if entity is not None:
+        pick.created[entity].extend(
+            body["id"] for status, _, _, body in results if status == 201 and isinstance(body, dict) and "id" in body
+        )
+
+    return summarize(results, wall)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    pick = Picker(random.Random(args.seed))
+    client = Client(args.url)
+    only = re.compile(args.only) if args.only else None
+
+    report = {
+        "meta": {
+            "url": args.url,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "commit": git_commit(),
+            "started_at": datetime.datetime.utcnow().isoformat(),
+        },
+        "scenarios": {},
+    }
+
+    for name, entity, share, build in SCENARIOS:
+        if only and not only.search(name):
+            continue
+
+        try:
+            # requests are built up front, so the timed part only sends them
+            requests = [build(pick) for _ in range(max(1, int(args.requests * share)))]
+        except Skip as reason:
+            report["scenarios"][name] = {"skipped": str(reason)}
+            print(f"{name:50} skipped, {reason}", file=sys.stderr)
+            continue
+
+        result = report["scenarios"][name] = run_scenario(client, pick, entity, requests, args.concurrency)
+        latency, queries = result["latency_ms"], result["queries_per_request"]
+        print(
+            f"{name:50} p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  p99 {latency['p99']:8.2f}ms  "
+            f"{result['throughput_rps']:8.1f} req/s  queries {queries['mean'] if queries else '-':>6}  {result['statuses']}",
+            file=sys.stderr
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+# Comparing
+
+def compare(args):
+    with open(args.before) as file:
+        before = json.load(file)["scenarios"]
+    with open(args.after) as file:
+        after = json.load(file)["scenarios"]
+
+    regressions = []
+    for name, old in before.items():
+        new = after.get(name)
+        if new is None or "skipped" in old or "skipped" in new:
+            continue
+
+        p95 = new["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1 if old["latency_ms"]["p95"] else 0
+        throughput = new["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0
+        old_queries = old["queries_per_request"]["mean"] if old["queries_per_request"] else None
+        new_queries = new["queries_per_request"]["mean"] if new["queries_per_request"] else None
+
+        problems = []
+        if p95 > args.tolerance:
+            problems.append(f"p95 {p95:+.0%}")
+        if throughput < -args.tolerance:
+            problems.append(f"throughput {throughput:+.0%}")
+        if old_queries is not None and new_queries is not None and new_queries > old_queries:
+            problems.append(f"queries {old_queries} -> {new_queries}")
+        if problems:
+            regressions.append(name)
+
+        print(
+            f"{name:50} p95 {old['latency_ms']['p95']:8.2f} -> {new['latency_ms']['p95']:8.2f}ms ({p95:+.0%})  "
+            f"{old['throughput_rps']:8.1f} -> {new['throughput_rps']:8.1f} req/s ({throughput:+.0%})  "
+            f"queries {old_queries if old_queries is not None else '-'} -> {new_queries if new_queries is not None else '-'}"
+            + (f"  REGRESSION: {', '.join(problems)}" if problems else "")
+        )
+
+    if regressions:
+        print(f"FAIL: {len(regressions)} routes regressed")
+        sys.exit(1)
+    print("ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed")
+    seed_parser.add_argument("--seed", type=int, default=1)
+    seed_parser.add_argument("--users", type=int, default=10000)
+    seed_parser.add_argument("--publications", type=int, default=5000)
+    seed_parser.add_argument("--authors", type=int, default=None, help="defaults to half the publications")
+    seed_parser.add_argument("--categories", type=int, default=50)
+    seed_parser.add_argument("--authors-per-publication", type=int, default=2)
+    seed_parser.add_argument("--instances-per-publication", type=int, default=3)
+    seed_parser.add_argument("--queues", type=int, default=500, help="publications with a reservation queue")
+    seed_parser.add_argument("--queue-length", type=int, default=5)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--url", default="http://localhost:8000")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--only", help="regular expression, run only the matching routes")
+    run_parser.add_argument("--output", help="report file, stdout by default")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+    {"seed": seed, "run": run, "compare": compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
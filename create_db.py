@@ -1,5 +1,23 @@
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
 from dbs_assignment.database import Base,engine
 from dbs_assignment.models import *
 
-Base.metadata.create_all(engine)
 
+def create_schema():
+    config = Config("alembic.ini")
+    tables = inspect(engine).get_table_names()
+
+    if "alembic_version" in tables or "users" in tables:
+        # databases created by older versions, with or without migrations, are upgraded
+        command.upgrade(config, "head")
+    else:
+        # a fresh database gets the schema of the models and is marked as up to date
+        Base.metadata.create_all(engine)
+        command.stamp(config, "head")
+
+
+if __name__ == "__main__":
+    create_schema()
@@ -1,12 +1,37 @@
 from fastapi import FastAPI
 
 # from dbs_assignment.database import Base, engine
+from dbs_assignment import invalidation, log, sweeper
+from dbs_assignment.metrics import MetricsMiddleware
+from dbs_assignment.config import settings
 from dbs_assignment.router import router
 
+log.setup()
+
 app = FastAPI(title="DBS")
 app.include_router(router)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+def start_cache_listener():
+    if settings.CACHE_LISTEN:
+        app.state.cache_listener = invalidation.start()
+
 
+@app.on_event("shutdown")
+def stop_cache_listener():
+    if settings.CACHE_LISTEN:
+        app.state.cache_listener.set()
 
 
+@app.on_event("startup")
+async def start_sweeper():
+    if settings.SWEEPER_ENABLED:
+        app.state.sweeper = sweeper.start()
 
 
+@app.on_event("shutdown")
+async def stop_sweeper():
+    if settings.SWEEPER_ENABLED:
+        app.state.sweeper.cancel()
@@ -0,0 +1,67 @@
+import inspect
+
+from fastapi import APIRouter, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import Response
+
+from dbs_assignment.database import get_async_db
+
+
+def make_async(router: APIRouter) -> APIRouter:
+    # Async twin of a router: every sync handler taking a `db` session becomes an `async def`
+    # endpoint on the asyncpg engine. The handler body runs through AsyncSession.run_sync,
+    # so both runtime modes share one implementation and give the same responses.
+    async_router = APIRouter()
+
+    for route in router.routes:
+        if not isinstance(route, APIRoute) or not uses_sync_session(route.endpoint):
+            async_router.routes.append(route)
+            continue
+
+        async_router.add_api_route(
+            route.path,
+            wrap_endpoint(route),
+            methods=list(route.methods),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            description=route.description,
+            name=route.name,
+            response_class=route.response_class,
+        )
+
+    return async_router
+
+
+def uses_sync_session(endpoint) -> bool:
+    return not inspect.iscoroutinefunction(endpoint) and "db" in inspect.signature(endpoint).parameters
+
+
+def wrap_endpoint(route: APIRoute):
+    endpoint = route.endpoint
+    signature = inspect.signature(endpoint)
+
+    def call(session, kwargs):
+        result = endpoint(db=session, **kwargs)
+        if route.response_field is None or isinstance(result, Response):
+            return result
+
+        # serialize inside run_sync, lazy loads are not allowed once we are back on the event loop
+        value, errors = route.response_field.validate(result, {}, loc=("response",))
+        if errors:
+            raise ValidationError(errors if isinstance(errors, list) else [errors], route.response_field.type_)
+        return jsonable_encoder(value)
+
+    async def async_endpoint(db: AsyncSession, **kwargs):
+        return await db.run_sync(call, kwargs)
+
+    async_endpoint.__name__ = endpoint.__name__
+    async_endpoint.__doc__ = endpoint.__doc__
+    async_endpoint.__signature__ = signature.replace(parameters=[
+        parameter.replace(annotation=AsyncSession, default=Depends(get_async_db)) if parameter.name == "db" else parameter
+        for parameter in signature.parameters.values()
+    ])
+
+    return async_endpoint
@@ -0,0 +1,141 @@
+import json
+from typing import List
+
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from dbs_assignment.config import settings
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class RowError(Exception):
+    pass
+
+
+class BulkError(BaseModel):
+    row: int
+    detail: str
+
+
+class BulkReport(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: List[BulkError] = []
+
+
+async def import_rows(request: Request, db: Session, prepare, write) -> BulkReport:
+    # Rows are validated and written in batches of BULK_BATCH_SIZE, each batch in its own transaction.
+    # prepare(db, batch, report) turns (index, row) pairs into (index, values) pairs and records
+    # the rows it rejects, write(db, values) inserts a list of values with multi-row INSERTs.
+    report = BulkReport()
+    batch = []
+
+    async for row in read_rows(request):
+        batch.append((report.received, row))
+        report.received += 1
+
+        if len(batch) == settings.BULK_BATCH_SIZE:
+            await run_in_threadpool(import_batch, db, batch, prepare, write, report)
+            batch = []
+
+    if batch:
+        await run_in_threadpool(import_batch, db, batch, prepare, write, report)
+
+    report.errors.sort(key=lambda error: error.row)
+    report.failed = len(report.errors)
+
+    return report
+
+
+async def read_rows(request: Request):
+    # NDJSON is parsed line by line while the body streams in, a JSON array has to be read whole
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_TYPES:
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield parse_line(line)
+        if pending.strip():
+            yield parse_line(pending)
+        return
+
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not valid JSON")
+
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array or an NDJSON stream")
+
+    for row in rows:
+        yield row
+
+
+def parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return RowError("Invalid JSON")
+
+
+def validate_rows(batch: list, schema, check, report: BulkReport) -> list:
+    # parses every row into the endpoint's pydantic model and runs the same checks as the single POST
+    valid = []
+
+    for index, row in batch:
+        try:
+            if isinstance(row, RowError):
+                raise row
+            if not isinstance(row, dict):
+                raise RowError("Expected a JSON object")
+            valid.append((index, check(schema.parse_obj(row))))
+        except ValidationError as error:
+            reject(report, index, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors()))
+        except HTTPException as error:
+            reject(report, index, str(error.detail))
+        except RowError as error:
+            reject(report, index, str(error))
+
+    return valid
+
+
+def reject(report: BulkReport, index: int, detail: str):
+    report.errors.append(BulkError(row=index, detail=detail))
+
+
+def import_batch(db: Session, batch: list, prepare, write, report: BulkReport):
+    rows = prepare(db, batch, report)
+    if not rows:
+        return
+
+    try:
+        write(db, [values for _, values in rows])
+        db.commit()
+        report.inserted += len(rows)
+    except DBAPIError:
+        db.rollback()
+
+        # some row broke a constraint, retry one by one so the rest of the batch still gets in
+        for index, values in rows:
+            try:
+                with db.begin_nested():
+                    write(db, [values])
+                report.inserted += 1
+            except DBAPIError as error:
+                reject(report, index, str(error.orig).strip().splitlines()[0])
+        db.commit()
+
+
+def insert_into(table):
+    def write(db: Session, rows: list):
+        db.execute(insert(table), rows)
+
+    return write
@@ -0,0 +1,229 @@
+import datetime
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from dbs_assignment.config import settings
+
+
+class CacheBackend:
+    # Values are plain response dicts, never ORM objects, so they outlive the session.
+    # Keys are tuples such as ("id", id) or ("name", name).
+    name: str
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def invalidate(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    # Bounded, thread safe LRU cache of one worker whose entries also expire after ttl seconds.
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "backend": "memory",
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Values in Redis are JSON, never pickles, so whoever can write to Redis can not run code in the
+# workers. Ids and times are tagged to come back as the same types, since cached rows are merged
+# into sessions and hashed into ETags.
+JSON_TYPES = {
+    "$uuid": uuid.UUID,
+    "$datetime": datetime.datetime.fromisoformat,
+    "$date": datetime.date.fromisoformat,
+}
+
+
+def json_default(value):
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    return jsonable_encoder(value)
+
+
+def json_object(value: dict):
+    if len(value) == 1:
+        (tag, text), = value.items()
+        if tag in JSON_TYPES:
+            return JSON_TYPES[tag](text)
+    return value
+
+
+class RedisBackend(CacheBackend):
+    # Cache shared by all workers in anything speaking the Redis protocol. Expiry is left to the
+    # server (SET EX) and so is eviction (maxmemory-policy), hits and misses are counted per worker.
+    def __init__(self, name: str, ttl: int, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(settings.REDIS_URL)
+
+        self.name = name
+        self.ttl = ttl
+        self.client = client
+        self.prefix = f"{settings.CACHE_PREFIX}:{name}:"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def redis_key(self, key) -> str:
+        return self.prefix + ":".join(str(part) for part in key)
+
+    def get(self, key):
+        value = self.client.get(self.redis_key(key))
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return json.loads(value, object_hook=json_object)
+
+    def set(self, key, value):
+        self.client.set(self.redis_key(key), json.dumps(value, default=json_default), ex=self.ttl)
+
+    def invalidate(self, *keys):
+        if keys:
+            self.client.delete(*[self.redis_key(key) for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self.client.delete(*keys[start:start + 1000])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"backend": "redis", "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+def make_cache(name: str) -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(name, settings.CACHE_TTL)
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryBackend(name, settings.CACHE_MAXSIZE, settings.CACHE_TTL)
+    raise ValueError(f"CACHE_BACKEND must be memory or redis, not {settings.CACHE_BACKEND}")
+
+
+# keyed by ("id", id) and by natural key: ("name", name, surname) for authors, ("name", name) for categories
+authors = make_cache("authors")
+categories = make_cache("categories")
+# keyed by ("id", id), the values embed author and category names
+publications = make_cache("publications")
+
+CACHES = [authors, categories, publications]
+
+
+def row_data(item) -> dict:
+    # generated search columns are left out, they are deferred and never part of a response
+    return {column.key: getattr(item, column.key) for column in item.__table__.columns if column.computed is None}
+
+
+def cache_author(author) -> dict:
+    data = row_data(author)
+    authors.set(("id", data["id"]), data)
+    authors.set(("name", data["name"], data["surname"]), data)
+    return data
+
+
+def cache_category(category) -> dict:
+    data = row_data(category)
+    categories.set(("id", data["id"]), data)
+    categories.set(("name", data["name"]), data)
+    return data
+
+
+def attach(db: Session, model, data: dict):
+    # turns a cached row back into a persistent object of the session without a SELECT
+    item = model(**data)
+    make_transient_to_detached(item)
+    return db.merge(item, load=False)
+
+
+# Invalidation, called by the writing handler after its commit and by the listener of every
+# worker for the rows the database reports as changed. Both take the row as it was before the write.
+
+def invalidate_author(id, name: str, surname: str):
+    # cached publications embed author names
+    authors.invalidate(("id", id), ("name", name, surname))
+    publications.clear()
+
+
+def invalidate_category(id, name: str):
+    # cached publications embed category names
+    categories.invalidate(("id", id), ("name", name))
+    publications.clear()
+
+
+def invalidate_publication(id):
+    publications.invalidate(("id", id))
@@ -16,6 +16,63 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.getenv("DATABASE_NAME", "tdd")
     DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+    # connection pool, sized per uvicorn worker
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 30))
+
+    # serve the routers as async endpoints on an asyncpg engine
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+    # rows validated and inserted per transaction by the /bulk endpoints
+    BULK_BATCH_SIZE: int = int(os.getenv("BULK_BATCH_SIZE", 1000))
+
+    # list endpoints, PAGE_SIZE_MAX is a hard cap on ?limit=
+    PAGE_SIZE_DEFAULT: int = int(os.getenv("PAGE_SIZE_DEFAULT", 50))
+    PAGE_SIZE_MAX: int = int(os.getenv("PAGE_SIZE_MAX", 500))
+
+    # ids accepted by one request to the /batch-get endpoints
+    BATCH_GET_MAX: int = int(os.getenv("BATCH_GET_MAX", 500))
+
+    # rows fetched per round trip from the server-side cursor of /export
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # read-through cache of authors, categories and publications, per cache
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_MAXSIZE: int = int(os.getenv("CACHE_MAXSIZE", 10000))
+    CACHE_TTL: int = int(os.getenv("CACHE_TTL", 300))
+    CACHE_PREFIX: str = os.getenv("CACHE_PREFIX", "dbs")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # drop cache entries of rows changed by other workers, seconds between reconnects
+    CACHE_LISTEN: bool = os.getenv("CACHE_LISTEN", "true").lower() == "true"
+    CACHE_LISTEN_RETRY: int = int(os.getenv("CACHE_LISTEN_RETRY", 5))
+
+    # debug header with the number of SQL statements the request executed
+    METRICS_QUERY_HEADER: bool = os.getenv("METRICS_QUERY_HEADER", "false").lower() == "true"
+
+    # JSON logs on stdout; SQL statements are logged when slower than LOG_SLOW_QUERY_MS
+    # and otherwise for a LOG_SQL_SAMPLE_RATE fraction of them, with LOG_REDACT parameters hidden
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_SQL_SAMPLE_RATE: float = float(os.getenv("LOG_SQL_SAMPLE_RATE", 0.0))
+    LOG_SLOW_QUERY_MS: float = float(os.getenv("LOG_SLOW_QUERY_MS", 200))
+    LOG_REDACT: str = os.getenv("LOG_REDACT", "email,personal_identificator,magstripe")
+
+    # background jobs of dbs_assignment.sweeper, in every app worker unless SWEEPER_ENABLED is false;
+    # seconds between runs and rows changed per transaction
+    SWEEPER_ENABLED: bool = os.getenv("SWEEPER_ENABLED", "true").lower() == "true"
+    SWEEPER_INTERVAL: int = int(os.getenv("SWEEPER_INTERVAL", 60))
+    SWEEPER_BATCH_SIZE: int = int(os.getenv("SWEEPER_BATCH_SIZE", 1000))
+
+    # hours the head of a reservation queue has to pick up the copy held for them,
+    # days delivered notifications are kept in the outbox
+    RESERVATION_HOLD_HOURS: int = int(os.getenv("RESERVATION_HOLD_HOURS", 48))
+    OUTBOX_RETENTION_DAYS: int = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+
+    # hours a stored response is replayed for requests repeating its Idempotency-Key
+    IDEMPOTENCY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+
 
     class Config:
         case_sensitive = True
@@ -4,6 +4,7 @@ from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy import create_engine
 from sqlalchemy_utils import database_exists, create_database
 
+from dbs_assignment import log, metrics
 from dbs_assignment.config import settings
 
 database_host = os.getenv("DATABASE_HOST")
@@ -12,15 +13,54 @@ database_name = os.getenv("DATABASE_NAME")
 database_user = os.getenv("DATABASE_USER")
 database_password = os.getenv("DATABASE_PASSWORD")
 
-engine = create_engine(f"postgresql://{database_user}:{database_password}@{database_host}:{database_port}/{database_name}", echo=True, pool_pre_ping=True)
+engine = create_engine(
+    f"postgresql://{database_user}:{database_password}@{database_host}:{database_port}/{database_name}",
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
+
+metrics.instrument(engine, log.log_query)
 
 if not database_exists(engine.url):
     create_database(engine.url)
 
 Base = declarative_base()
 
-SessionLocal = sessionmaker(bind=engine)
+# objects stay usable after commit, flushes already fetched server generated values with RETURNING
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(
+        f"postgresql+asyncpg://{database_user}:{database_password}@{database_host}:{database_port}/{database_name}",
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+
+    metrics.instrument(async_engine.sync_engine, log.log_query)
+
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
 
+def get_db():
+    # one session per request, returned to the pool when the request is done
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
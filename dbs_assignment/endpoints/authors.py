@@ -2,37 +2,53 @@ import datetime
 import uuid
 from typing import List
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
-from sqlalchemy.orm import joinedload
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import bulk, cache, etag, search
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 class Author(BaseModel):
     id: uuid.UUID = None
     name: str = None
     surname: str = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
-router = APIRouter()
+class AuthorPage(BaseModel):
+    items: List[Author]
+    next_cursor: str = None
 
-db = SessionLocal()
+    class Config:
+        orm_mode = True
 
-# Authors
 
-@router.post("/authors", response_model=Author, status_code=status.HTTP_201_CREATED, description="Author was crated")
-def create_author(author: Author):
+router = APIRouter()
+
+
+def check_new_author(author: Author) -> Author:
     if author.name is None or author.surname is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
     if author.name == "" or author.surname == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
+    return author
+
+# Authors
+
+@router.post("/authors", response_model=Author, status_code=status.HTTP_201_CREATED, description="Author was crated")
+def create_author(author: Author, db: Session = Depends(get_db)):
+    check_new_author(author)
+
     if db.query(models.Author).filter(models.Author.name == author.name, models.Author.surname == author.surname).first():
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Author with this name and surname already exits")
 
@@ -54,19 +70,32 @@ def create_author(author: Author):
 
     return new_item
 
+@router.get("/authors", response_model=AuthorPage, status_code=status.HTTP_200_OK, description="Authors were listed")
+def list_authors(cursor: str = None, limit: int = Depends(page_size), name: str = None, surname: str = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Author), name=name, surname=surname)
+
+    return paginate(query, models.Author, cursor, limit)
+
 @router.get("/authors/{author_id}", response_model=Author, status_code=status.HTTP_200_OK, description="Author was found")
-def get_author(author_id: str):
-    if not db.query(models.Author).filter(models.Author.id == author_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Author not found")
+def get_author(author_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(author_id, "Author not found")
+    not_modified = etag.if_none_match(request, db, models.Author, key, "Author not found")
+    if not_modified:
+        return not_modified
 
-    author = db.query(models.Author).filter(models.Author.id == author_id).first()
+    author = cache.authors.get(("id", key))
+    if author is None:
+        author = cache.cache_author(get_or_404(db, models.Author, key, "Author not found"))
+    etag.tag(response, models.Author, author)
 
     return author
 
 @router.patch("/authors/{author_id}", response_model=Author, status_code=status.HTTP_200_OK, description="Author informations was updated")
-def update_author(author_id: str, author: Author):
-    if not db.query(models.Author).filter(models.Author.id == author_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Author not found")
+def update_author(author_id: str, author: Author, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(author_id, "Author not found")
+    etag.if_match(request, db, models.Author, key, "Author not found")
+    author_to_update = get_or_404(db, models.Author, key, "Author not found")
+    cached_row = (author_to_update.id, author_to_update.name, author_to_update.surname)
 
     if author.name is None and author.surname is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
@@ -74,7 +103,6 @@ def update_author(author_id: str, author: Author):
     if author.name == "" or author.surname == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    author_to_update = db.query(models.Author).filter(models.Author.id == author_id).first()
 
     if db.query(models.Author).filter(models.Author.name == author.name, models.Author.surname == author.surname).first():
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Author with this name and surname already exits")
@@ -84,17 +112,53 @@ def update_author(author_id: str, author: Author):
     if not author.surname is None:
         author_to_update.surname = author.surname
 
+    db.flush()
+    search.refresh_publications(db, search.linked_publications(db, models.publication_authors.c.author_id, key))
 
     db.commit()
+    cache.invalidate_author(*cached_row)
+    etag.tag(response, models.Author, author_to_update)
 
     return author_to_update
 
 @router.delete("/authors/{author_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_author(author_id: str):
-    if not db.query(models.Author).filter(models.Author.id == author_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Author not found")
+def delete_author(author_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(author_id, "Author not found")
+    etag.if_match(request, db, models.Author, key, "Author not found")
+    author_to_delete = get_or_404(db, models.Author, key, "Author not found")
+    cached_row = (author_to_delete.id, author_to_delete.name, author_to_delete.surname)
 
-    author_to_delete = db.query(models.Author).filter(models.Author.id == author_id).first()
+    linked = search.linked_publications(db, models.publication_authors.c.author_id, key)
 
     db.delete(author_to_delete)
+    db.flush()
+    search.refresh_publications(db, linked)
     db.commit()
+    cache.invalidate_author(*cached_row)
+
+
+# Bulk import
+
+def prepare_authors(db: Session, batch: list, report: bulk.BulkReport) -> list:
+    rows = bulk.validate_rows(batch, Author, check_new_author, report)
+
+    # one tuple IN for the whole batch instead of a lookup per author
+    names = [(author.name, author.surname) for _, author in rows]
+    taken = set(db.query(models.Author.name, models.Author.surname).filter(
+        tuple_(models.Author.name, models.Author.surname).in_(names)
+    ).all()) if names else set()
+
+    prepared = []
+    for index, author in rows:
+        if (author.name, author.surname) in taken:
+            bulk.reject(report, index, "Author with this name and surname already exits")
+            continue
+        taken.add((author.name, author.surname))
+        prepared.append((index, {"id": author.id or uuid.uuid4(), "name": author.name, "surname": author.surname}))
+
+    return prepared
+
+
+@router.post("/authors/bulk", response_model=bulk.BulkReport, status_code=status.HTTP_200_OK, description="Authors were imported")
+async def bulk_create_authors(request: Request, db: Session = Depends(get_db)):
+    return await bulk.import_rows(request, db, prepare_authors, bulk.insert_into(models.Author.__table__))
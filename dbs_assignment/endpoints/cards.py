@@ -1,12 +1,17 @@
 import datetime
 import uuid
+from typing import List
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Request, Response
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 from enum import Enum
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import etag
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 class CardStatus(str, Enum):
@@ -21,24 +26,30 @@ class Card(BaseModel):
     magstripe: str = None
     # status: CardStatus = None
     status: str = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
 
-router = APIRouter()
+class CardPage(BaseModel):
+    items: List[Card]
+    next_cursor: str = None
 
-db = SessionLocal()
+    class Config:
+        orm_mode = True
+
+
+router = APIRouter()
 
 
 @router.post("/cards", response_model=Card, status_code=status.HTTP_201_CREATED)
-def create_card(card: Card):
+def create_card(card: Card, db: Session = Depends(get_db)):
     if card.user_id is None or card.magstripe is None or card.status is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
-    if not db.query(models.User).filter(models.User.id == card.user_id).first():
+    if not db.get(models.User, card.user_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
 
     if card.magstripe == "":
@@ -59,35 +70,43 @@ def create_card(card: Card):
 
     db.add(new_item)
     db.commit()
-    db.rollback()
 
     return new_item
 
 
+@router.get("/cards", response_model=CardPage, status_code=status.HTTP_200_OK, description="Cards were listed")
+def list_cards(cursor: str = None, limit: int = Depends(page_size), user_id: uuid.UUID = None, status_filter: str = Query(None, alias="status"), db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Card), user_id=user_id, status=status_filter)
+
+    return paginate(query, models.Card, cursor, limit)
+
 @router.get("/cards/{card_id}", response_model=Card, status_code=status.HTTP_200_OK, description="OK")
-def get_card(card_id: str):
-    if not db.query(models.Card).filter(models.Card.id == card_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Card not found")
+def get_card(card_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(card_id, "Card not found")
+    not_modified = etag.if_none_match(request, db, models.Card, key, "Card not found")
+    if not_modified:
+        return not_modified
 
-    card = db.query(models.Card).filter(models.Card.id == card_id).first()
+    card = get_or_404(db, models.Card, key, "Card not found")
+    etag.tag(response, models.Card, card)
 
     return card
 
 
 @router.patch("/cards/{card_id}", response_model=Card, status_code=status.HTTP_200_OK, description="Card updated")
-def update_card(card_id: str, card: Card):
-    if not db.query(models.Card).filter(models.Card.id == card_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Card not found")
+def update_card(card_id: str, card: Card, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(card_id, "Card not found")
+    etag.if_match(request, db, models.Card, key, "Card not found")
+    card_to_update = get_or_404(db, models.Card, key, "Card not found")
     if card.user_id is None and card.status is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
     if not card.user_id is None:
-        if not db.query(models.User).filter(models.User.id == card.user_id).first():
+        if not db.get(models.User, card.user_id):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
 
     if card.status not in ["active", "inactive", "expired"]:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    card_to_update = db.query(models.Card).filter(models.Card.id == card_id).first()
 
     if not card.user_id is None:
         card_to_update.user_id = card.user_id
@@ -95,16 +114,16 @@ def update_card(card_id: str, card: Card):
         card_to_update.status = card.status
 
     db.commit()
+    etag.tag(response, models.Card, card_to_update)
 
     return card_to_update
 
 
 @router.delete("/cards/{card_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_card(card_id: str):
-    if not db.query(models.Card).filter(models.Card.id == card_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Card not found")
-
-    card_to_delete = db.query(models.Card).filter(models.Card.id == card_id).first()
+def delete_card(card_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(card_id, "Card not found")
+    etag.if_match(request, db, models.Card, key, "Card not found")
+    card_to_delete = get_or_404(db, models.Card, key, "Card not found")
 
     db.delete(card_to_delete)
     db.commit()
@@ -2,45 +2,58 @@ import datetime
 import uuid
 from typing import List
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import bulk, cache, etag, search
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 
 class Category(BaseModel):
     id: uuid.UUID = None
     name: str = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
 
-router = APIRouter()
+class CategoryPage(BaseModel):
+    items: List[Category]
+    next_cursor: str = None
 
-db = SessionLocal()
+    class Config:
+        orm_mode = True
 
-# Categories
 
-@router.post("/categories", response_model=Category, status_code=status.HTTP_201_CREATED, description="Category was created")
-def create_category(category: Category):
+router = APIRouter()
+
+
+def check_new_category(category: Category) -> Category:
     if category.name is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
-    if category.name == "":
+    if category.name == "" or category.name.isnumeric():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
+    return category
+
+# Categories
+
+@router.post("/categories", response_model=Category, status_code=status.HTTP_201_CREATED, description="Category was created")
+def create_category(category: Category, db: Session = Depends(get_db)):
+    check_new_category(category)
+
     if db.query(models.Category).filter(models.Category.name == category.name).first():
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="This category already exits")
 
-    if category.name.isnumeric():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
-
     if category.id is None:
         category.id = uuid.uuid4()
 
@@ -54,19 +67,32 @@ def create_category(category: Category):
 
     return new_item
 
+@router.get("/categories", response_model=CategoryPage, status_code=status.HTTP_200_OK, description="Categories were listed")
+def list_categories(cursor: str = None, limit: int = Depends(page_size), name: str = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Category), name=name)
+
+    return paginate(query, models.Category, cursor, limit)
+
 @router.get("/categories/{category_id}", response_model=Category, status_code=status.HTTP_200_OK, description="Category was found")
-def get_category(category_id: str):
-    if not db.query(models.Category).filter(models.Category.id == category_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+def get_category(category_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(category_id, "Category not found")
+    not_modified = etag.if_none_match(request, db, models.Category, key, "Category not found")
+    if not_modified:
+        return not_modified
 
-    category = db.query(models.Category).filter(models.Category.id == category_id).first()
+    category = cache.categories.get(("id", key))
+    if category is None:
+        category = cache.cache_category(get_or_404(db, models.Category, key, "Category not found"))
+    etag.tag(response, models.Category, category)
 
     return category
 
 @router.patch("/categories/{category_id}", response_model=Category, status_code=status.HTTP_200_OK, description="Category informations was updated")
-def update_category(category_id: str, category: Category):
-    if not db.query(models.Category).filter(models.Category.id == category_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+def update_category(category_id: str, category: Category, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(category_id, "Category not found")
+    etag.if_match(request, db, models.Category, key, "Category not found")
+    category_to_update = get_or_404(db, models.Category, key, "Category not found")
+    cached_row = (category_to_update.id, category_to_update.name)
 
     if category.name is None or category.name == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
@@ -78,20 +104,53 @@ def update_category(category_id: str, category: Category):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
 
-    category_to_update = db.query(models.Category).filter(models.Category.id == category_id).first()
 
     category_to_update.name = category.name
 
+    db.flush()
+    search.refresh_publications(db, search.linked_publications(db, models.publication_categories.c.category_id, key))
+
     db.commit()
+    cache.invalidate_category(*cached_row)
+    etag.tag(response, models.Category, category_to_update)
 
     return category_to_update
 
 @router.delete("/categories/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_category(category_id: str):
-    if not db.query(models.Category).filter(models.Category.id == category_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+def delete_category(category_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(category_id, "Category not found")
+    etag.if_match(request, db, models.Category, key, "Category not found")
+    category_to_delete = get_or_404(db, models.Category, key, "Category not found")
+    cached_row = (category_to_delete.id, category_to_delete.name)
 
-    category_to_delete = db.query(models.Category).filter(models.Category.id == category_id).first()
+    linked = search.linked_publications(db, models.publication_categories.c.category_id, key)
 
     db.delete(category_to_delete)
+    db.flush()
+    search.refresh_publications(db, linked)
     db.commit()
+    cache.invalidate_category(*cached_row)
+
+
+# Bulk import
+
+def prepare_categories(db: Session, batch: list, report: bulk.BulkReport) -> list:
+    rows = bulk.validate_rows(batch, Category, check_new_category, report)
+
+    names = [category.name for _, category in rows]
+    taken = set(db.scalars(select(models.Category.name).where(models.Category.name.in_(names)))) if names else set()
+
+    prepared = []
+    for index, category in rows:
+        if category.name in taken:
+            bulk.reject(report, index, "This category already exits")
+            continue
+        taken.add(category.name)
+        prepared.append((index, {"id": category.id or uuid.uuid4(), "name": category.name}))
+
+    return prepared
+
+
+@router.post("/categories/bulk", response_model=bulk.BulkReport, status_code=status.HTTP_200_OK, description="Categories were imported")
+async def bulk_create_categories(request: Request, db: Session = Depends(get_db)):
+    return await bulk.import_rows(request, db, prepare_categories, bulk.insert_into(models.Category.__table__))
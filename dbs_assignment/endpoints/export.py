@@ -0,0 +1,79 @@
+import csv
+import io
+
+from fastapi import APIRouter, status, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+import dbs_assignment.models as models
+from dbs_assignment.config import settings
+from dbs_assignment.database import SessionLocal
+from dbs_assignment.endpoints.instances import Instance
+from dbs_assignment.endpoints.rentals import RentalResponse
+from dbs_assignment.endpoints.reservations import Reservation
+
+
+EXPORTS = {
+    "rentals": (models.Rental, RentalResponse),
+    "instances": (models.Instance, Instance),
+    "reservations": (models.Reservation, Reservation),
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+router = APIRouter()
+
+
+@router.get("/export/{entity}", status_code=status.HTTP_200_OK, description="Rows are streamed as NDJSON or CSV")
+def export(entity: str, format: str = "ndjson"):
+    if entity not in EXPORTS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown export")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
+
+    model, schema = EXPORTS[entity]
+
+    return StreamingResponse(
+        stream_rows(model, schema, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'}
+    )
+
+
+def stream_rows(model, schema, format: str):
+    # The rows come from a server-side cursor EXPORT_BATCH_SIZE at a time and every batch is
+    # encoded and sent before the next one is fetched, so memory stays flat for any table size.
+    # The generator owns its session since it keeps running after the handler has returned.
+    db = SessionLocal()
+    try:
+        statement = select(model).order_by(model.created_at, model.id).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        columns = list(schema.__fields__)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if format == "csv":
+            writer.writerow(columns)
+
+        for rows in db.execute(statement).scalars().partitions():
+            for row in rows:
+                item = schema.from_orm(row)
+                if format == "csv":
+                    values = jsonable_encoder(item)
+                    writer.writerow(["" if values[column] is None else values[column] for column in columns])
+                else:
+                    buffer.write(item.json())
+                    buffer.write("\n")
+
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            db.expunge_all()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
@@ -1,12 +1,18 @@
 import datetime
 import uuid
+from typing import List
 from enum import Enum
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Request, Response
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import bulk, etag
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import BatchGet, get_many, get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 class InstanceType(str, Enum):
     physical = "physical"
@@ -26,25 +32,42 @@ class Instance(BaseModel):
     year: int = None
     status: InstanceStatus = None
     publication_id: uuid.UUID = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
+class InstancePage(BaseModel):
+    items: List[Instance]
+    next_cursor: str = None
+
+    class Config:
+        orm_mode = True
+
+class InstanceBatch(BaseModel):
+    items: List[Instance]
+    missing: List[str]
+
+
 router = APIRouter()
 
-db = SessionLocal()
 
-@router.post("/instances", status_code=status.HTTP_201_CREATED, description="Instance was created", response_model=Instance)
-def create_instance(instance: Instance):
+def check_new_instance(instance: Instance) -> Instance:
     if instance.type is None or instance.publisher is None or instance.year is None or instance.status is None or instance.publication_id is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
     if instance.publisher == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    if not db.query(models.Publication).filter(models.Publication.id == instance.publication_id).first():
+    return instance
+
+
+@router.post("/instances", status_code=status.HTTP_201_CREATED, description="Instance was created", response_model=Instance)
+def create_instance(instance: Instance, db: Session = Depends(get_db)):
+    check_new_instance(instance)
+
+    if not db.get(models.Publication, instance.publication_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication does not exits")
 
 
@@ -58,9 +81,7 @@ def create_instance(instance: Instance):
         year = instance.year,
         status = instance.status,
         # status = "available",
-        publication_id = instance.publication_id,
-        created_at = instance.created_at,
-        updated_at = instance.updated_at
+        publication_id = instance.publication_id
     )
 
     db.add(new_item)
@@ -68,58 +89,93 @@ def create_instance(instance: Instance):
 
     return new_item
 
+@router.get("/instances", response_model=InstancePage, status_code=status.HTTP_200_OK, description="Instances were listed")
+def list_instances(cursor: str = None, limit: int = Depends(page_size), publication_id: uuid.UUID = None, type: InstanceType = None, status_filter: InstanceStatus = Query(None, alias="status"), publisher: str = None, year: int = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Instance), publication_id=publication_id, type=type, status=status_filter, publisher=publisher, year=year)
+
+    return paginate(query, models.Instance, cursor, limit)
+
+@router.post("/instances/batch-get", response_model=InstanceBatch, status_code=status.HTTP_200_OK, description="Instances were found")
+def batch_get_instances(batch: BatchGet, db: Session = Depends(get_db)):
+    return get_many(db, models.Instance, batch.ids)
+
 @router.get("/instances/{instance_id}", status_code=status.HTTP_200_OK, description="Instance was found", response_model=Instance)
-def get_instance(instance_id: str):
-    if not db.query(models.Instance).filter(models.Instance.id == instance_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Instance not found")
+def get_instance(instance_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(instance_id, "Instance not found")
+    not_modified = etag.if_none_match(request, db, models.Instance, key, "Instance not found")
+    if not_modified:
+        return not_modified
 
-    instance = db.query(models.Instance).filter(models.Instance.id == instance_id).first()
+    instance = get_or_404(db, models.Instance, key, "Instance not found")
+    etag.tag(response, models.Instance, instance)
 
     return instance
 
 @router.patch("/instances/{instance_id}", status_code=status.HTTP_200_OK, description="Instance was updated", response_model=Instance)
-def update_instance(instance_id: str, instance: Instance):
-    if not db.query(models.Instance).filter(models.Instance.id == instance_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Instance not found")
-
-    instance_to_update = db.query(models.Instance).filter(models.Instance.id == instance_id).first()
+def update_instance(instance_id: str, instance: Instance, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(instance_id, "Instance not found")
+    etag.if_match(request, db, models.Instance, key, "Instance not found")
+    instance_to_update = get_or_404(db, models.Instance, key, "Instance not found")
 
     if not instance.type is None:
         instance_to_update.type = instance.type
-        instance_to_update.updated_at = instance.updated_at
 
     if not instance.publisher is None:
         if instance.publisher == "":
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
         instance_to_update.publisher = instance.publisher
-        instance_to_update.updated_at = instance.updated_at
 
     if not instance.year is None:
         instance_to_update.year = instance.year
-        instance_to_update.updated_at = instance.updated_at
 
     if not instance.status is None:
         instance_to_update.status = instance.status
-        instance_to_update.updated_at = instance.updated_at
 
     if not instance.publication_id is None:
-        if not db.query(models.Publication).filter(models.Publication.id == instance.publication_id).first():
+        if not db.get(models.Publication, instance.publication_id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication does not exits")
         instance_to_update.publication_id = instance.publication_id
-        instance_to_update.updated_at = instance.updated_at
 
     db.commit()
+    etag.tag(response, models.Instance, instance_to_update)
 
     return instance_to_update
 
 @router.delete("/instances/{instance_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_instance(instance_id: str):
-    if not db.query(models.Instance).filter(models.Instance.id == instance_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Instance not found")
-
-    instance_to_delete = db.query(models.Instance).filter(models.Instance.id == instance_id).first()
+def delete_instance(instance_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(instance_id, "Instance not found")
+    etag.if_match(request, db, models.Instance, key, "Instance not found")
+    instance_to_delete = get_or_404(db, models.Instance, key, "Instance not found")
 
     db.delete(instance_to_delete)
     db.commit()
 
 
+# Bulk import
+
+def prepare_instances(db: Session, batch: list, report: bulk.BulkReport) -> list:
+    rows = bulk.validate_rows(batch, Instance, check_new_instance, report)
+
+    publication_ids = {instance.publication_id for _, instance in rows}
+    existing = set(db.scalars(select(models.Publication.id).where(models.Publication.id.in_(publication_ids)))) if publication_ids else set()
+
+    prepared = []
+    for index, instance in rows:
+        if instance.publication_id not in existing:
+            bulk.reject(report, index, "Publication does not exits")
+            continue
+        prepared.append((index, {
+            "id": instance.id or uuid.uuid4(),
+            "type": instance.type.value,
+            "publisher": instance.publisher,
+            "year": instance.year,
+            "status": instance.status.value,
+            "publication_id": instance.publication_id
+        }))
+
+    return prepared
+
+
+@router.post("/instances/bulk", response_model=bulk.BulkReport, status_code=status.HTTP_200_OK, description="Instances were imported")
+async def bulk_create_instances(request: Request, db: Session = Depends(get_db)):
+    return await bulk.import_rows(request, db, prepare_instances, bulk.insert_into(models.Instance.__table__))
@@ -1,12 +1,17 @@
 import datetime
 import uuid
+from typing import List
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Header, Request, Response
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import bulk, cache, etag, idempotency, search
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import BatchGet, get_many, get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 class Publication(BaseModel):
@@ -14,54 +19,155 @@ class Publication(BaseModel):
     title: str = None
     authors: list = None
     categories: list = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
+class Availability(BaseModel):
+    available: int = 0
+    reserved: int = 0
+    unavailable: int = 0
+
+class PublicationAvailability(BaseModel):
+    publication_id: uuid.UUID
+    physical: Availability
+    ebook: Availability
+    audiobook: Availability
+
+class PublicationPage(BaseModel):
+    items: List[Publication]
+    next_cursor: str = None
+
+class PublicationBatch(BaseModel):
+    items: List[Publication]
+    missing: List[str]
+
+
 router = APIRouter()
 
-db = SessionLocal()
 
+def load_publication(db: Session, publication_id):
+    # one statement for the publication with its authors, one more for the categories
+    return db.query(models.Publication).options(
+        joinedload(models.Publication.authors),
+        selectinload(models.Publication.categories)
+    ).filter(models.Publication.id == publication_id).first()
 
-# Publications
 
-@router.post("/publications", status_code=status.HTTP_201_CREATED, description="Publication was created", response_model=Publication)
-def create_publication(publication: Publication):
+def publication_data(publication: models.Publication) -> dict:
+    return {
+        "id": publication.id,
+        "title": publication.title,
+        "authors": [{"name": author.name, "surname": author.surname} for author in publication.authors],
+        "categories": [category.name for category in publication.categories],
+        "created_at": publication.created_at,
+        "updated_at": publication.updated_at
+    }
+
+
+def resolve_authors(db: Session, authors: list):
+    # authors resolved recently come from the cache, the rest in one tuple IN query
+    # backed by the (name, surname) index; returns the authors and the names not found
+    names = [(item["name"], item["surname"]) for item in authors]
+    found = {}
+    for name, surname in names:
+        cached = cache.authors.get(("name", name, surname))
+        if cached is not None:
+            found[(name, surname)] = cache.attach(db, models.Author, cached)
+
+    unknown = [key for key in names if key not in found]
+    if unknown:
+        for author in db.query(models.Author).filter(tuple_(models.Author.name, models.Author.surname).in_(unknown)):
+            cache.cache_author(author)
+            found[(author.name, author.surname)] = author
+
+    missing = [{"name": name, "surname": surname} for name, surname in names if (name, surname) not in found]
+
+    authors_list = []
+    for key in names:
+        if key in found and found[key] not in authors_list:
+            authors_list.append(found[key])
+
+    return authors_list, missing
+
+
+def resolve_categories(db: Session, categories: list):
+    found = {}
+    for name in categories:
+        cached = cache.categories.get(("name", name))
+        if cached is not None:
+            found[name] = cache.attach(db, models.Category, cached)
+
+    unknown = [name for name in categories if name not in found]
+    if unknown:
+        for category in db.query(models.Category).filter(models.Category.name.in_(unknown)):
+            cache.cache_category(category)
+            found[category.name] = category
+
+    missing = [name for name in categories if name not in found]
+
+    categories_list = []
+    for name in categories:
+        if name in found and found[name] not in categories_list:
+            categories_list.append(found[name])
+
+    return categories_list, missing
+
+
+def resolve_links(db: Session, authors: list, categories: list):
+    # Either list may be None when it is not being changed. Unknown authors and categories
+    # are reported together in one 400.
+    authors_list, missing_authors = resolve_authors(db, authors) if authors is not None else (None, [])
+    categories_list, missing_categories = resolve_categories(db, categories) if categories is not None else (None, [])
+
+    if missing_authors or missing_categories:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={
+            "message": "Authors or categories not exist",
+            "missing": {"authors": missing_authors, "categories": missing_categories}
+        })
+
+    return authors_list, categories_list
+
+
+def check_new_publication(publication: Publication) -> Publication:
     if publication.title is None or publication.authors is None or publication.categories is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
     if publication.title == "" or len(publication.authors) == 0 or len(publication.categories) == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
+    if any(not isinstance(item, dict) or "name" not in item or "surname" not in item for item in publication.authors):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
+    return publication
 
-    if publication.id is None:
-        publication.id = uuid.uuid4()
 
-    authors_list = []
-    categories_list = []
+# Publications
 
-    for item in publication.authors:
-        if not db.query(models.Author).filter(models.Author.name == item["name"],models.Author.surname == item["surname"]).first():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author not exists")
-        author = db.query(models.Author).filter(models.Author.name == item["name"], models.Author.surname == item["surname"]).first()
-        authors_list.append(author)
+@router.post("/publications", status_code=status.HTTP_201_CREATED, description="Publication was created", response_model=Publication)
+def create_publication(publication: Publication, idempotency_key: str = Header(None, max_length=255), db: Session = Depends(get_db)):
+    fingerprint = idempotency.fingerprint(publication)
+    replay = idempotency.replay(db, idempotency_key, "publications", fingerprint)
+    if replay:
+        return replay
 
-    for item in publication.categories:
-        if not db.query(models.Category).filter(models.Category.name == item).first():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Category not exists")
-        category = db.query(models.Category).filter(models.Category.name == item).first()
-        categories_list.append(category)
+    check_new_publication(publication)
+
+    if publication.id is None:
+        publication.id = uuid.uuid4()
+
+    authors_list, categories_list = resolve_links(db, publication.authors, publication.categories)
 
     new_item = models.Publication(
         id=publication.id,
         title=publication.title,
         authors=authors_list,
         categories = categories_list,
+        search_names = search.names(authors_list, categories_list)
     )
 
     db.add(new_item)
-    db.commit()
+    db.flush()
 
     data = {"id": new_item.id, "title": new_item.title, "authors": [], "categories": [], "created_at": new_item.created_at, "updated_at": new_item.updated_at}
 
@@ -71,120 +177,181 @@ def create_publication(publication: Publication):
     for item in publication.categories:
         data["categories"].append(item)
 
+    replay = idempotency.save(db, idempotency_key, "publications", fingerprint, status.HTTP_201_CREATED, data)
+    if replay:
+        return replay
+    db.commit()
+
     return data
 
-@router.get("/publications/{publication_id}", status_code=status.HTTP_200_OK, description="Publication was found", response_model=Publication)
-def get_publication(publication_id: str):
-    if not db.query(models.Publication).filter(models.Publication.id == publication_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication not found")
+@router.get("/publications", response_model=PublicationPage, status_code=status.HTTP_200_OK, description="Publications were listed")
+def list_publications(cursor: str = None, limit: int = Depends(page_size), title: str = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Publication), title=title).options(
+        selectinload(models.Publication.authors),
+        selectinload(models.Publication.categories)
+    )
+    page = paginate(query, models.Publication, cursor, limit)
+
+    return {"items": [publication_data(publication) for publication in page["items"]], "next_cursor": page["next_cursor"]}
 
-    publication_id = db.query(models.Publication.id).filter(models.Publication.id == publication_id).scalar()
-    publication_title = db.query(models.Publication.title).filter(models.Publication.id == publication_id).scalar()
+@router.post("/publications/batch-get", response_model=PublicationBatch, status_code=status.HTTP_200_OK, description="Publications were found")
+def batch_get_publications(batch: BatchGet, db: Session = Depends(get_db)):
+    found = get_many(db, models.Publication, batch.ids, selectinload(models.Publication.authors), selectinload(models.Publication.categories))
 
-    authors = select(models.publication_authors.c.author_id).filter(models.publication_authors.c.publication_id == publication_id)
-    result_authors = db.execute(authors)
-    results_authors = result_authors.scalars().all()
+    return {"items": [publication_data(publication) for publication in found["items"]], "missing": found["missing"]}
 
-    categories = select(models.publication_categories.c.category_id).filter(models.publication_categories.c.publication_id == publication_id)
-    result_categories = db.execute(categories)
-    results_categories = result_categories.scalars().all()
+@router.get("/publications/{publication_id}", status_code=status.HTTP_200_OK, description="Publication was found", response_model=Publication)
+def get_publication(publication_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(publication_id, "Publication not found")
+    not_modified = etag.if_none_match(request, db, models.Publication, key, "Publication not found")
+    if not_modified:
+        return not_modified
+
+    data = cache.publications.get(("id", key))
+    if data is None:
+        publication = load_publication(db, key)
+        if not publication:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication not found")
+
+        data = publication_data(publication)
+        cache.publications.set(("id", key), data)
+    etag.tag(response, models.Publication, data)
 
-    created_at = db.query(models.Publication.created_at).filter(models.Publication.id == publication_id).scalar()
-    updated_at = db.query(models.Publication.updated_at).filter(models.Publication.id == publication_id).scalar()
+    return data
 
+@router.get("/publications/{publication_id}/availability", status_code=status.HTTP_200_OK, description="Copies by type and status", response_model=PublicationAvailability)
+def get_publication_availability(publication_id: str, db: Session = Depends(get_db)):
+    # a single row read of the counters the instances trigger maintains
+    key = parse_id(publication_id, "Publication not found")
+    counters = db.get(models.PublicationAvailability, key)
 
-    data = {"id": publication_id,  "title": publication_title, "authors": [], "categories": [], "created_at": created_at, "updated_at": updated_at}
-    for author in results_authors:
-        author_name = db.query(models.Author.name).filter(models.Author.id == author).scalar()
-        author_surname = db.query(models.Author.surname).filter(models.Author.id == author).scalar()
-        data["authors"].append({"name": author_name, "surname": author_surname})
-    for category in results_categories:
-        category_name = db.query(models.Category.name).filter(models.Category.id == category).scalar()
-        data["categories"].append(category_name)
+    if counters is None:
+        # no copy was ever added
+        get_or_404(db, models.Publication, key, "Publication not found")
 
-    return data
+    return {"publication_id": key, **{
+        kind: {
+            state: getattr(counters, f"{kind}_{state}") if counters else 0
+            for state in ("available", "reserved", "unavailable")
+        }
+        for kind in ("physical", "ebook", "audiobook")
+    }}
 
 @router.patch("/publications/{publication_id}", status_code=status.HTTP_200_OK, description="Publication was updated")
-def update_publication(publication_id: str, publication: Publication):
-    if not db.query(models.Publication).filter(models.Publication.id == publication_id).first():
+def update_publication(publication_id: str, publication: Publication, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(publication_id, "Publication not found")
+    etag.if_match(request, db, models.Publication, key, "Publication not found")
+    publication_to_update = load_publication(db, key)
+    if not publication_to_update:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication not found")
 
-    publication_to_update = db.query(models.Publication).filter(models.Publication.id == publication_id).first()
-
+    # a change of authors or categories only touches the link tables, so updated_at is set explicitly
     if not publication.title is None:
         if publication.title == "":
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
         publication_to_update.title = publication.title
-        publication_to_update.updated_at = datetime.datetime.utcnow()
+        publication_to_update.updated_at = models.utc_now()
 
-    authors_list = []
-    categories_list = []
+    if publication.authors == [] or publication.categories == []:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    if not publication.authors is None:
-        if len(publication.authors) == 0:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
-        for item in publication.authors:
-            if not db.query(models.Author).filter(models.Author.name == item["name"],models.Author.surname == item["surname"]).first():
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author not exists")
-            author = db.query(models.Author).filter(models.Author.name == item["name"], models.Author.surname == item["surname"]).first()
-            authors_list.append(author)
+    authors_list, categories_list = resolve_links(db, publication.authors, publication.categories)
+
+    if not authors_list is None:
         publication_to_update.authors = authors_list
-        publication_to_update.updated_at = datetime.datetime.utcnow()
+        publication_to_update.updated_at = models.utc_now()
 
-    if not publication.categories is None:
-        if len(publication.categories) == 0:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
-        for item in publication.categories:
-            if not db.query(models.Category).filter(models.Category.name == item).first():
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Category not exists")
-            category = db.query(models.Category).filter(models.Category.name == item).first()
-            categories_list.append(category)
+    if not categories_list is None:
         publication_to_update.categories = categories_list
-        publication_to_update.updated_at = datetime.datetime.utcnow()
-
-    db.commit()
+        publication_to_update.updated_at = models.utc_now()
 
-    data = {"id": publication_to_update.id, "title": publication_to_update.title, "authors": [], "categories": [],
-            "created_at": publication_to_update.created_at, "updated_at": publication_to_update.updated_at}
+    if not publication.authors is None or not publication.categories is None:
+        publication_to_update.search_names = search.names(publication_to_update.authors, publication_to_update.categories)
 
-    authors = select(models.publication_authors.c.author_id).filter(
-        models.publication_authors.c.publication_id == publication_id)
-    result_authors = db.execute(authors)
-    results_authors = result_authors.scalars().all()
+    cached_id = publication_to_update.id
 
-    categories = select(models.publication_categories.c.category_id).filter(
-        models.publication_categories.c.publication_id == publication_id)
-    result_categories = db.execute(categories)
-    results_categories = result_categories.scalars().all()
+    db.commit()
+    cache.invalidate_publication(cached_id)
 
-    for author in results_authors:
-        author_name = db.query(models.Author.name).filter(models.Author.id == author).scalar()
-        author_surname = db.query(models.Author.surname).filter(models.Author.id == author).scalar()
-        data["authors"].append({"name": author_name, "surname": author_surname})
-    for category in results_categories:
-        category_name = db.query(models.Category.name).filter(models.Category.id == category).scalar()
-        data["categories"].append(category_name)
+    data = publication_data(load_publication(db, key))
+    etag.tag(response, models.Publication, data)
 
     return data
 
 @router.delete("/publications/{publication_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_publication(publication_id: str):
-    if not db.query(models.Publication).filter(models.Publication.id == publication_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publication not found")
+def delete_publication(publication_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(publication_id, "Publication not found")
+    etag.if_match(request, db, models.Publication, key, "Publication not found")
+    publication_to_delete = get_or_404(db, models.Publication, key, "Publication not found")
 
-    publication_to_delete = db.query(models.Publication).filter(models.Publication.id == publication_id).first()
+    db.query(models.Instance).filter(models.Instance.publication_id == publication_to_delete.id).delete(synchronize_session=False)
 
-    while db.query(models.Instance).filter(models.Instance.publication_id == publication_id).first():
-        instance_to_delete = db.query(models.Instance).filter(models.Instance.publication_id == publication_id).first()
-        db.delete(instance_to_delete)
+    cached_id = publication_to_delete.id
 
     db.delete(publication_to_delete)
     db.commit()
-
-
-
-
-
-
-
+    cache.invalidate_publication(cached_id)
+
+
+# Bulk import
+
+def prepare_publications(db: Session, batch: list, report: bulk.BulkReport) -> list:
+    rows = bulk.validate_rows(batch, Publication, check_new_publication, report)
+
+    # names of the whole batch resolved with one query per entity type
+    author_names = {(item["name"], item["surname"]) for _, publication in rows for item in publication.authors}
+    category_names = {name for _, publication in rows for name in publication.categories}
+
+    authors = {
+        (name, surname): id
+        for id, name, surname in db.query(models.Author.id, models.Author.name, models.Author.surname).filter(
+            tuple_(models.Author.name, models.Author.surname).in_(author_names)
+        )
+    } if author_names else {}
+    categories = {
+        name: id
+        for id, name in db.query(models.Category.id, models.Category.name).filter(models.Category.name.in_(category_names))
+    } if category_names else {}
+
+    prepared = []
+    for index, publication in rows:
+        names = [(item["name"], item["surname"]) for item in publication.authors]
+        missing_authors = [f"{name} {surname}" for name, surname in names if (name, surname) not in authors]
+        missing_categories = [name for name in publication.categories if name not in categories]
+
+        if missing_authors or missing_categories:
+            problems = []
+            if missing_authors:
+                problems.append("Author not exists: " + ", ".join(missing_authors))
+            if missing_categories:
+                problems.append("Category not exists: " + ", ".join(missing_categories))
+            bulk.reject(report, index, "; ".join(problems))
+            continue
+
+        prepared.append((index, {
+            "id": publication.id or uuid.uuid4(),
+            "title": publication.title,
+            "search_names": " ".join([f"{name} {surname}" for name, surname in names] + publication.categories),
+            "authors": list(dict.fromkeys(authors[key] for key in names)),
+            "categories": list(dict.fromkeys(categories[name] for name in publication.categories))
+        }))
+
+    return prepared
+
+
+def write_publications(db: Session, rows: list):
+    db.execute(insert(models.Publication.__table__), [
+        {"id": row["id"], "title": row["title"], "search_names": row["search_names"]} for row in rows
+    ])
+    db.execute(insert(models.publication_authors), [
+        {"publication_id": row["id"], "author_id": author_id} for row in rows for author_id in row["authors"]
+    ])
+    db.execute(insert(models.publication_categories), [
+        {"publication_id": row["id"], "category_id": category_id} for row in rows for category_id in row["categories"]
+    ])
+
+
+@router.post("/publications/bulk", response_model=bulk.BulkReport, status_code=status.HTTP_200_OK, description="Publications were imported")
+async def bulk_create_publications(request: Request, db: Session = Depends(get_db)):
+    return await bulk.import_rows(request, db, prepare_publications, write_publications)
@@ -1,12 +1,17 @@
 from datetime import date, timedelta, datetime
 import uuid
-from sqlalchemy import select
+from typing import List
+from sqlalchemy import func, or_, select, update
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Header, Request, Response
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import etag, idempotency, reservation_queue
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import BatchGet, get_many, get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 class Rental(BaseModel):
@@ -17,7 +22,7 @@ class Rental(BaseModel):
     duration: int = None
     start_date: date = None
     end_date: date = None
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = None
 
     class Config:
         orm_mode = True
@@ -30,17 +35,89 @@ class RentalResponse(BaseModel):
     start_date: date = None
     end_date: date = None
     status: str = None
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = None
 
     class Config:
         orm_mode = True
 
+class RentalPage(BaseModel):
+    items: List[RentalResponse]
+    next_cursor: str = None
+
+    class Config:
+        orm_mode = True
+
+class RentalBatch(BaseModel):
+    items: List[RentalResponse]
+    missing: List[str]
+
+
 router = APIRouter()
 
-db = SessionLocal()
+# rentals whose copy has not come back yet, the sweeper moves active ones past end_date to overdue
+OPEN_STATUSES = ("active", "overdue")
+
+
+def allocate_instance(db: Session, publication_id, user_id):
+    # Picks and takes a copy in one statement. The copy is locked with FOR UPDATE SKIP LOCKED, so
+    # concurrent rentals never get the same one, and it is only taken if the user may rent:
+    # either the queue is shorter than the number of available copies, or the user's place in
+    # the queue is within that number. Places are read from reservations.position, reservations
+    # holding a copy are the first places and are not counted.
+    # Returns the id of the copy, or None when there is nothing the user may take.
+    held = db.execute(
+        update(models.Instance)
+        .where(
+            models.Instance.id == select(models.Reservation.hold_instance_id).where(
+                models.Reservation.publication_id == publication_id,
+                models.Reservation.user_id == user_id,
+                models.Reservation.hold_instance_id.is_not(None)
+            ).limit(1).scalar_subquery(),
+            models.Instance.status == "reserved"
+        )
+        .values(status="unavailable")
+        .returning(models.Instance.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if held is not None:
+        # the copy held for the user
+        return held
+
+    holds = reservation_queue.holds(db, publication_id)
+    available = select(func.count()).where(
+        models.Instance.publication_id == publication_id,
+        models.Instance.status == "available"
+    ).scalar_subquery()
+
+    queue_length = select(func.coalesce(func.max(models.Reservation.position), 0)).where(
+        models.Reservation.publication_id == publication_id
+    ).scalar_subquery()
+    user_position = select(func.min(models.Reservation.position)).where(
+        models.Reservation.publication_id == publication_id,
+        models.Reservation.user_id == user_id
+    ).scalar_subquery()
+
+    candidate = select(models.Instance.id).where(
+        models.Instance.publication_id == publication_id,
+        models.Instance.status == "available",
+        or_(queue_length - holds < available, user_position - holds <= available)
+    ).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+    return db.execute(
+        update(models.Instance)
+        .where(models.Instance.id == candidate, models.Instance.status == "available")
+        .values(status="unavailable")
+        .returning(models.Instance.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
 
 @router.post("/rentals", status_code=status.HTTP_201_CREATED, response_model=RentalResponse, description="Rental was created")
-def create_rental(rental: Rental):
+def create_rental(rental: Rental, idempotency_key: str = Header(None, max_length=255), db: Session = Depends(get_db)):
+    fingerprint = idempotency.fingerprint(rental)
+    replay = idempotency.replay(db, idempotency_key, "rentals", fingerprint)
+    if replay:
+        return replay
 
     if rental.user_id is None or rental.publication_id is None or rental.duration is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
@@ -52,96 +129,103 @@ def create_rental(rental: Rental):
     if rental.id is None:
         rental.id = uuid.uuid4()
 
-    publication_instances = select(models.Instance.id).filter(models.Instance.publication_id == rental.publication_id).where(models.Instance.status == "available")
-    result_publication_instances = db.execute(publication_instances)
-    available_publication_instances = result_publication_instances.scalars().all()
-
-    if len(available_publication_instances) == 0:
+    instance_id = allocate_instance(db, rental.publication_id, rental.user_id)
+    if instance_id is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    get_reservations = db.query(models.Reservation.user_id).filter(models.Reservation.publication_id == rental.publication_id).order_by(models.Reservation.created_at.asc())
-    result_reservations = db.execute(get_reservations)
-    reservations_users = result_reservations.scalars().all()
-
-    can_create_rental: bool = False
-
-    if len(reservations_users) > 0:
-        if len(reservations_users) >= len(available_publication_instances):
-            pom = 1
-            for reservation in reservations_users:
-                reservation_to_delete = db.query(models.Reservation).filter(models.Reservation.publication_id == rental.publication_id,
-                                                                            models.Reservation.user_id == reservation).first()
-                if (reservation == rental.user_id and pom <= len(available_publication_instances) and reservation_to_delete):
-                    # db.delete(reservation_to_delete)
-                    # db.commit()
-                    can_create_rental = True
-                pom = pom + 1
-        if len(reservations_users) < len(available_publication_instances):
-            for reservation in reservations_users:
-                reservation_to_delete = db.query(models.Reservation).filter(models.Reservation.publication_id == rental.publication_id,
-                                                                            models.Reservation.user_id == reservation).first()
-                # if (reservation == rental.user_id and reservation_to_delete):
-                    # db.delete(reservation_to_delete)
-                    # db.commit()
-            can_create_rental = True
-    if len(reservations_users) == 0:
-        can_create_rental = True
-
-
-    if can_create_rental == False:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
-
-    first_available_instance_id = None
-    for first_instance in available_publication_instances:
-        first_available_instance_id = first_instance
-        break
-
-    user = db.query(models.User).filter(models.User.id == rental.user_id).first()
-
-    # test
-    instance_for_change = db.query(models.Instance).filter(models.Instance.id == first_available_instance_id).first()
-    instance_for_change.status = "unavailable"
-
+    reservation_queue.promote(db, rental.publication_id, rental.user_id)
 
     new_item = models.Rental(
         id = rental.id,
         user_id = rental.user_id,
-        publication_instance_id = first_available_instance_id,
+        publication_instance_id = instance_id,
         duration = rental.duration,
         start_date = date.today(),
         end_date = date.today() + timedelta(days=rental.duration),
-        status = "active",
-        user = user
+        status = "active"
     )
 
     db.add(new_item)
-    db.commit()
+    db.flush()
 
+    replay = idempotency.save(db, idempotency_key, "rentals", fingerprint, status.HTTP_201_CREATED, RentalResponse.from_orm(new_item))
+    if replay:
+        return replay
+    db.commit()
 
     return new_item
 
+@router.get("/rentals", response_model=RentalPage, status_code=status.HTTP_200_OK, description="Rentals were listed")
+def list_rentals(cursor: str = None, limit: int = Depends(page_size), user_id: uuid.UUID = None, publication_instance_id: uuid.UUID = None, status_filter: str = Query(None, alias="status"), db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Rental), user_id=user_id, publication_instance_id=publication_instance_id, status=status_filter)
+
+    return paginate(query, models.Rental, cursor, limit)
+
+@router.post("/rentals/batch-get", response_model=RentalBatch, status_code=status.HTTP_200_OK, description="Rentals were found")
+def batch_get_rentals(batch: BatchGet, db: Session = Depends(get_db)):
+    return get_many(db, models.Rental, batch.ids)
+
 @router.get("/rentals/{rental_id}", status_code=status.HTTP_200_OK, response_model=RentalResponse, description="Rental was found")
-def get_rental(rental_id: str):
-    if not db.query(models.Rental).filter(models.Rental.id == rental_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rental not found")
+def get_rental(rental_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(rental_id, "Rental not found")
+    not_modified = etag.if_none_match(request, db, models.Rental, key, "Rental not found")
+    if not_modified:
+        return not_modified
 
-    rental = db.query(models.Rental).filter(models.Rental.id == rental_id).first()
+    rental = get_or_404(db, models.Rental, key, "Rental not found")
+    etag.tag(response, models.Rental, rental)
 
     return rental
 
 @router.patch("/rentals/{rental_id}", status_code=status.HTTP_200_OK, response_model=RentalResponse, description="Rental was found")
-def update_rental(rental_id: str, rental:Rental):
-    if not db.query(models.Rental).filter(models.Rental.id == rental_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rental not found")
+def update_rental(rental_id: str, rental:Rental, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(rental_id, "Rental not found")
+    etag.if_match(request, db, models.Rental, key, "Rental not found")
+    rental_to_update = get_or_404(db, models.Rental, key, "Rental not found")
 
     if rental.duration is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
-    rental_to_update = db.query(models.Rental).filter(models.Rental.id == rental_id).first()
-
     rental_to_update.duration = rental.duration
     rental_to_update.end_date = date.today() + timedelta(days=rental.duration)
 
     db.commit()
+    etag.tag(response, models.Rental, rental_to_update)
 
     return  rental_to_update
+
+def end_rental(db: Session, rental_id: str, request: Request, rental_status: str, instance_status: str) -> models.Rental:
+    key = parse_id(rental_id, "Rental not found")
+    etag.if_match(request, db, models.Rental, key, "Rental not found")
+
+    # the row lock keeps a concurrent return and the sweeper from both ending the rental
+    rental = db.get(models.Rental, key, with_for_update=True)
+    if rental is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rental not found")
+    if rental.status not in OPEN_STATUSES:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Rental is already closed")
+
+    rental.status = rental_status
+    db.execute(
+        update(models.Instance)
+        .where(models.Instance.id == rental.publication_instance_id)
+        .values(status=instance_status)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    return rental
+
+@router.post("/rentals/{rental_id}/return", status_code=status.HTTP_200_OK, response_model=RentalResponse, description="Rental was returned, its copy is available again")
+def return_rental(rental_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    rental = end_rental(db, rental_id, request, "returned", "available")
+    etag.tag(response, models.Rental, rental)
+
+    return rental
+
+@router.post("/rentals/{rental_id}/close", status_code=status.HTTP_200_OK, response_model=RentalResponse, description="Rental was closed, its copy stays unavailable if it was lost")
+def close_rental(rental_id: str, request: Request, response: Response, lost: bool = False, db: Session = Depends(get_db)):
+    rental = end_rental(db, rental_id, request, "closed", "unavailable" if lost else "available")
+    etag.tag(response, models.Rental, rental)
+
+    return rental
@@ -1,28 +1,58 @@
 import datetime
 import uuid
+from typing import List
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Header, Request, Response
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import etag, idempotency, reservation_queue
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import BatchGet, get_many, get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 class Reservation(BaseModel):
     id: uuid.UUID = None
     user_id: uuid.UUID = None
     publication_id: uuid.UUID = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
+    position: int = None
+    hold_instance_id: uuid.UUID = None
+    hold_expires_at: datetime.datetime = None
+    created_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
 
-router = APIRouter()
+class QueuePosition(BaseModel):
+    reservation_id: uuid.UUID
+    publication_id: uuid.UUID
+    user_id: uuid.UUID
+    position: int
+    queue_length: int
+
+class ReservationPage(BaseModel):
+    items: List[Reservation]
+    next_cursor: str = None
+
+    class Config:
+        orm_mode = True
 
-db = SessionLocal()
+class ReservationBatch(BaseModel):
+    items: List[Reservation]
+    missing: List[str]
+
+
+router = APIRouter()
 
 @router.post("/reservations", status_code=status.HTTP_201_CREATED, description="Reservation was created", response_model=Reservation)
-def create_reservation(reservation: Reservation):
+def create_reservation(reservation: Reservation, idempotency_key: str = Header(None, max_length=255), db: Session = Depends(get_db)):
+    fingerprint = idempotency.fingerprint(reservation)
+    replay = idempotency.replay(db, idempotency_key, "reservations", fingerprint)
+    if replay:
+        return replay
+
     if reservation.user_id is None or reservation.publication_id is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
 
@@ -32,36 +62,66 @@ def create_reservation(reservation: Reservation):
     if reservation.user_id == "" or reservation.publication_id == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    user = db.query(models.User).filter(models.User.id == reservation.user_id).first()
+    get_or_404(db, models.User, reservation.user_id, "User not found")
+    get_or_404(db, models.Publication, reservation.publication_id, "Publication not found")
 
     new_item = models.Reservation(
         id = reservation.id,
         user_id = reservation.user_id,
-        user = user,
         publication_id = reservation.publication_id
     )
 
-    db.add(new_item)
+    reservation_queue.enqueue(db, new_item)
+    db.flush()
+
+    replay = idempotency.save(db, idempotency_key, "reservations", fingerprint, status.HTTP_201_CREATED, Reservation.from_orm(new_item))
+    if replay:
+        return replay
     db.commit()
 
     return new_item
 
+@router.get("/reservations", response_model=ReservationPage, status_code=status.HTTP_200_OK, description="Reservations were listed")
+def list_reservations(cursor: str = None, limit: int = Depends(page_size), user_id: uuid.UUID = None, publication_id: uuid.UUID = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.Reservation), user_id=user_id, publication_id=publication_id)
+
+    return paginate(query, models.Reservation, cursor, limit)
+
+@router.post("/reservations/batch-get", response_model=ReservationBatch, status_code=status.HTTP_200_OK, description="Reservations were found")
+def batch_get_reservations(batch: BatchGet, db: Session = Depends(get_db)):
+    return get_many(db, models.Reservation, batch.ids)
+
 @router.get("/reservations/{reservation_id}", status_code=status.HTTP_200_OK, description="Reservation was found", response_model=Reservation)
-def get_reservation(reservation_id: str):
-    if not db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found")
+def get_reservation(reservation_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(reservation_id, "Reservation not found")
+    not_modified = etag.if_none_match(request, db, models.Reservation, key, "Reservation not found")
+    if not_modified:
+        return not_modified
 
-    reservation = db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
+    reservation = get_or_404(db, models.Reservation, key, "Reservation not found")
+    etag.tag(response, models.Reservation, reservation)
 
     return reservation
 
 
-@router.delete("/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_reservation(reservation_id: str):
-    if not db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found")
+@router.get("/reservations/{reservation_id}/position", status_code=status.HTTP_200_OK, description="Place of the reservation in the queue", response_model=QueuePosition)
+def get_reservation_position(reservation_id: str, db: Session = Depends(get_db)):
+    reservation = get_or_404(db, models.Reservation, reservation_id, "Reservation not found")
+
+    return {
+        "reservation_id": reservation.id,
+        "publication_id": reservation.publication_id,
+        "user_id": reservation.user_id,
+        "position": reservation.position,
+        "queue_length": reservation_queue.length(db, reservation.publication_id)
+    }
 
-    reservation_to_delete = db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
 
-    db.delete(reservation_to_delete)
+@router.delete("/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_reservation(reservation_id: str, request: Request, db: Session = Depends(get_db)):
+    key = parse_id(reservation_id, "Reservation not found")
+    etag.if_match(request, db, models.Reservation, key, "Reservation not found")
+    reservation_to_delete = get_or_404(db, models.Reservation, key, "Reservation not found")
+
+    reservation_queue.remove(db, reservation_to_delete)
     db.commit()
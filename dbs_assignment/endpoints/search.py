@@ -0,0 +1,82 @@
+import uuid
+from typing import List
+
+from fastapi import APIRouter, status, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy import func, literal, or_, select
+from sqlalchemy.orm import Session, selectinload
+
+import dbs_assignment.models as models
+from dbs_assignment.database import get_db
+from dbs_assignment.endpoints.instances import InstanceType
+from dbs_assignment.endpoints.publications import Publication, publication_data
+from dbs_assignment.pagination import page_size
+
+
+class AuthorHit(BaseModel):
+    id: uuid.UUID
+    name: str
+    surname: str
+
+class CategoryHit(BaseModel):
+    id: uuid.UUID
+    name: str
+
+class SearchResult(BaseModel):
+    publications: List[Publication]
+    authors: List[AuthorHit]
+    categories: List[CategoryHit]
+
+
+router = APIRouter()
+
+
+def matching(search_vector, document, q: str):
+    # Full text match on whole words, or a trigram match of q against some part of the
+    # document, which finds misspelled and partly typed words. Both are served by GIN indexes.
+    text_query = func.websearch_to_tsquery('simple', q)
+    match = or_(search_vector.bool_op('@@')(text_query), literal(q).bool_op('<%')(document))
+    rank = func.ts_rank_cd(search_vector, text_query) + func.word_similarity(q, document)
+    return match, rank
+
+
+@router.get("/search", response_model=SearchResult, status_code=status.HTTP_200_OK, description="Catalogue was searched")
+def search(q: str = Query(..., min_length=1), category: str = None, type: InstanceType = None, limit: int = Depends(page_size), db: Session = Depends(get_db)):
+    match, rank = matching(models.Publication.search_vector, models.Publication.search_document, q)
+    query = select(models.Publication.id).where(match)
+
+    if category is not None:
+        query = query.where(models.Publication.id.in_(
+            select(models.publication_categories.c.publication_id).join(models.Category).where(models.Category.name == category)
+        ))
+    if type is not None:
+        # publications with a copy of this type, read from the counters the instances trigger maintains
+        counters = [getattr(models.PublicationAvailability, f"{type.value}_{state}") for state in ("available", "reserved", "unavailable")]
+        query = query.where(models.Publication.id.in_(
+            select(models.PublicationAvailability.publication_id).where(sum(counters[1:], counters[0]) > 0)
+        ))
+
+    ids = db.scalars(query.order_by(rank.desc(), models.Publication.id).limit(limit)).all()
+    # ranked ids first, then one statement per relationship for the whole page
+    found = {publication.id: publication for publication in db.scalars(
+        select(models.Publication).where(models.Publication.id.in_(ids)).options(
+            selectinload(models.Publication.authors),
+            selectinload(models.Publication.categories)
+        )
+    )} if ids else {}
+
+    match, rank = matching(models.Author.search_vector, models.Author.full_name, q)
+    authors = db.execute(
+        select(models.Author.id, models.Author.name, models.Author.surname).where(match).order_by(rank.desc(), models.Author.id).limit(limit)
+    ).all()
+
+    match, rank = matching(models.Category.search_vector, models.Category.name, q)
+    categories = db.execute(
+        select(models.Category.id, models.Category.name).where(match).order_by(rank.desc(), models.Category.id).limit(limit)
+    ).all()
+
+    return {
+        "publications": [publication_data(found[id]) for id in ids],
+        "authors": [row._asdict() for row in authors],
+        "categories": [row._asdict() for row in categories],
+    }
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from dbs_assignment import cache, metrics
+
+router = APIRouter()
+
+
+@router.get("/cache/stats", status_code=status.HTTP_200_OK, description="Hit, miss and eviction counts of the read caches")
+def cache_stats():
+    return {item.name: item.stats() for item in cache.CACHES}
+
+
+@router.get("/metrics", response_class=PlainTextResponse, status_code=status.HTTP_200_OK, description="Prometheus metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,18 @@
 import datetime
 import uuid
+from typing import List
 import datetime
 
 
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 import dbs_assignment.models as models
-from dbs_assignment.database import SessionLocal
+from dbs_assignment import etag
+from dbs_assignment.database import get_db
+from dbs_assignment.lookup import BatchGet, get_many, get_or_404, parse_id
+from dbs_assignment.pagination import filter_by, page_size, paginate
 
 
 class User(BaseModel):
@@ -18,8 +23,8 @@ class User(BaseModel):
     # birth_date: datetime.date = None
     birth_date: str = None
     personal_identificator: str = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
 
     class Config:
         orm_mode = True
@@ -32,8 +37,8 @@ class ResponseUser(BaseModel):
     # birth_date: datetime.date = None
     birth_date: str = None
     personal_identificator: str = None
-    created_at: datetime.datetime = datetime.datetime.utcnow()
-    updated_at: datetime.datetime = datetime.datetime.utcnow()
+    created_at: datetime.datetime = None
+    updated_at: datetime.datetime = None
     reservations: list = None
     rentals: list = None
 
@@ -41,12 +46,22 @@ class ResponseUser(BaseModel):
         orm_mode = True
 
 
-router = APIRouter()
+class UserPage(BaseModel):
+    items: List[User]
+    next_cursor: str = None
+
+    class Config:
+        orm_mode = True
+
+class UserBatch(BaseModel):
+    items: List[User]
+    missing: List[str]
 
-db = SessionLocal()
+
+router = APIRouter()
 
 @router.post("/users", response_model=User, status_code=status.HTTP_201_CREATED)
-def add_user(user: User):
+def add_user(user: User, db: Session = Depends(get_db)):
 
     if user.id is None or user.name is None or user.surname is None or user.email is None or user.birth_date is None or user.personal_identificator is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required information")
@@ -70,35 +85,44 @@ def add_user(user: User):
         surname = user.surname,
         email = user.email,
         birth_date = user.birth_date,
-        personal_identificator = user.personal_identificator,
-        created_at = datetime.utcnow(),
-        updated_at = datetime.utcnow()
+        personal_identificator = user.personal_identificator
     )
 
     db.add(new_item)
     db.commit()
-    db.rollback()
 
     return new_item
 
+@router.get("/users", response_model=UserPage, status_code=status.HTTP_200_OK, description="Users were listed")
+def list_users(cursor: str = None, limit: int = Depends(page_size), name: str = None, surname: str = None, email: str = None, db: Session = Depends(get_db)):
+    query = filter_by(db.query(models.User), name=name, surname=surname, email=email)
+
+    return paginate(query, models.User, cursor, limit)
+
+@router.post("/users/batch-get", response_model=UserBatch, status_code=status.HTTP_200_OK, description="Users were found")
+def batch_get_users(batch: BatchGet, db: Session = Depends(get_db)):
+    return get_many(db, models.User, batch.ids)
+
 @router.get("/users/{user_id}", response_model=ResponseUser, status_code=status.HTTP_200_OK, description="User found")
-def get_user(user_id: str):
-    if not db.query(models.User).filter(models.User.id == user_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+def get_user(user_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(user_id, "User not found")
+    not_modified = etag.if_none_match(request, db, models.User, key, "User not found")
+    if not_modified:
+        return not_modified
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = get_or_404(db, models.User, key, "User not found")
+    etag.tag(response, models.User, user, db)
 
     return user
 
 @router.patch("/users/{user_id}", response_model=User, status_code=status.HTTP_200_OK, description="User updated")
-def update_user(user_id: str, user: User):
-    if not db.query(models.User).filter(models.User.id == user_id).first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+def update_user(user_id: str, user: User, request: Request, response: Response, db: Session = Depends(get_db)):
+    key = parse_id(user_id, "User not found")
+    etag.if_match(request, db, models.User, key, "User not found")
+    user_to_update = get_or_404(db, models.User, key, "User not found")
     if user.id == "" or user.name == "" or user.surname == "" or user.email == "" or user.birth_date == "" or user.personal_identificator == "":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request")
 
-    user_to_update = db.query(models.User).filter(models.User.id == user_id).first()
-
 
     if(user_to_update.email != user.email):
         if db.query(models.User).filter(models.User.email == user.email).first():
@@ -116,6 +140,7 @@ def update_user(user_id: str, user: User):
         user_to_update.personal_identificator = user.personal_identificator
 
     db.commit()
+    etag.tag(response, models.User, user_to_update, db)
 
     return user_to_update
 
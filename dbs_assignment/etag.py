@@ -0,0 +1,90 @@
+import hashlib
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+
+
+def user_links_version(link_model, *columns):
+    # one value that changes whenever a rental or reservation of the user is added, changed or removed
+    return select(func.concat_ws(":", func.count(), *columns)).where(
+        link_model.user_id == models.User.id
+    ).scalar_subquery()
+
+
+def version_columns(model) -> tuple:
+    # reservations are never updated, only their place in the queue and their hold move
+    if model is models.Reservation:
+        return model.created_at, model.position, model.hold_expires_at
+    # a user is sent with their rentals and reservations
+    if model is models.User:
+        return (
+            model.updated_at,
+            user_links_version(models.Rental, func.max(models.Rental.updated_at)),
+            user_links_version(
+                models.Reservation, func.max(models.Reservation.created_at),
+                func.sum(models.Reservation.position), func.max(models.Reservation.hold_expires_at)
+            ),
+        )
+
+    return model.updated_at,
+
+
+def make(id, *version) -> str:
+    # strong validator, it changes whenever the version columns do
+    return '"' + hashlib.sha1(":".join(map(str, (id, *version))).encode()).hexdigest() + '"'
+
+
+def tag(response: Response, model, item, db: Session = None):
+    # item is a row of the model or its cached dict, versions read from other tables need db
+    if db is not None:
+        response.headers["ETag"] = current(db, model, item.id, "Resource not found")
+    elif isinstance(item, dict):
+        response.headers["ETag"] = make(item["id"], *(item[column.key] for column in version_columns(model)))
+    else:
+        response.headers["ETag"] = make(item.id, *(getattr(item, column.key) for column in version_columns(model)))
+
+
+def matches(header: str, etag: str) -> bool:
+    tags = [item.strip() for item in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def current(db: Session, model, id, detail: str, lock: bool = False) -> str:
+    # only the version columns are read, the row is not loaded into the session
+    query = select(*version_columns(model)).where(model.id == id)
+    if lock:
+        query = query.with_for_update(of=model)
+
+    row = db.execute(query).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+    return make(id, *row)
+
+
+def if_none_match(request: Request, db: Session, model, id, detail: str):
+    # a 304 response when the client already has this version, None when the resource has to be sent
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+
+    etag = current(db, model, id, detail)
+    if matches(header, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    return None
+
+
+def if_match(request: Request, db: Session, model, id, detail: str):
+    # The row stays locked until the handler commits, so nobody can change it between
+    # this check and the write.
+    header = request.headers.get("if-match")
+    if header is None:
+        return
+
+    if not matches(header, current(db, model, id, detail, lock=True)):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Resource was modified")
+
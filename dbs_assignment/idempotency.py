@@ -0,0 +1,93 @@
+import hashlib
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+from dbs_assignment.config import settings
+
+# POST requests sent with an Idempotency-Key header store their response in idempotency_keys,
+# in the transaction that creates the resource. A retry with the same key gets the stored
+# response from one primary key lookup and changes nothing. Requests that failed stored
+# nothing, so their retries run again. Keys are scoped per endpoint and purged by the
+# sweeper after IDEMPOTENCY_TTL_HOURS.
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(body: BaseModel) -> str:
+    # taken before the handler fills in defaults such as a generated id
+    return hashlib.sha256(body.json(sort_keys=True).encode()).hexdigest()
+
+
+def stored_response(row) -> JSONResponse:
+    return JSONResponse(status_code=row.status_code, content=row.body, headers={REPLAYED_HEADER: "true"})
+
+
+def expired():
+    # keys past IDEMPOTENCY_TTL_HOURS are never replayed, whether or not the sweeper purged them yet
+    return models.IdempotencyKey.created_at < models.utc_now() - func.make_interval(0, 0, 0, 0, settings.IDEMPOTENCY_TTL_HOURS)
+
+
+def replay(db: Session, key: str, scope: str, request_fingerprint: str):
+    # the stored response of an earlier request with this key, or None
+    if key is None:
+        return None
+
+    row = db.execute(
+        select(models.IdempotencyKey.fingerprint, models.IdempotencyKey.status_code, models.IdempotencyKey.body)
+        .where(models.IdempotencyKey.scope == scope, models.IdempotencyKey.key == key, ~expired())
+    ).first()
+    if row is None:
+        return None
+
+    if row.fingerprint != request_fingerprint:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Idempotency-Key was used with a different request")
+
+    return stored_response(row)
+
+
+def save(db: Session, key: str, scope: str, request_fingerprint: str, status_code: int, body):
+    # Stores the response in the caller's transaction, which still has to commit, taking over
+    # an expired key. Returns None, or, when a concurrent request with the same key committed
+    # first, rolls the caller's work back and returns that request's response instead.
+    if key is None:
+        return None
+
+    values = {"fingerprint": request_fingerprint, "status_code": status_code, "body": jsonable_encoder(body)}
+    stored = db.execute(
+        insert(models.IdempotencyKey)
+        .values(scope=scope, key=key, **values)
+        .on_conflict_do_update(
+            index_elements=[models.IdempotencyKey.scope, models.IdempotencyKey.key],
+            set_={**values, "created_at": models.utc_now()},
+            where=expired()
+        )
+        .returning(models.IdempotencyKey.key)
+    ).scalar()
+    if stored is not None:
+        return None
+
+    db.rollback()
+    stored_replay = replay(db, key, scope, request_fingerprint)
+    if stored_replay is None:
+        # the other request's key expired or was purged in between, nothing was created
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Idempotency-Key conflicts with another request, retry it")
+
+    return stored_replay
+
+
+def purge(db: Session, batch_size: int) -> int:
+    # keys older than IDEMPOTENCY_TTL_HOURS, a sweeper job
+    old = select(models.IdempotencyKey.scope, models.IdempotencyKey.key).where(expired()).limit(batch_size).with_for_update(skip_locked=True)
+
+    return db.execute(
+        delete(models.IdempotencyKey)
+        .where(tuple_(models.IdempotencyKey.scope, models.IdempotencyKey.key).in_(old))
+        .execution_options(synchronize_session=False)
+    ).rowcount
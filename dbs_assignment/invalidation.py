@@ -0,0 +1,69 @@
+import json
+import logging
+import select
+import threading
+import uuid
+
+from dbs_assignment import cache
+from dbs_assignment.config import settings
+from dbs_assignment.database import engine
+
+CHANNEL = "cache_invalidation"
+
+logger = logging.getLogger(__name__)
+
+
+def apply(payload: str):
+    # payload is {"table": ..., "row": ...} with the row as it was before the UPDATE or DELETE
+    message = json.loads(payload)
+    row = message["row"]
+    id = uuid.UUID(row["id"])
+
+    if message["table"] == "authors":
+        cache.invalidate_author(id, row["name"], row["surname"])
+    elif message["table"] == "categories":
+        cache.invalidate_category(id, row["name"])
+    elif message["table"] == "publications":
+        cache.invalidate_publication(id)
+
+
+def listen(stop: threading.Event):
+    # One connection per worker kept out of the pool, reconnecting after errors.
+    # Notifications are delivered right after the writing transaction commits.
+    while not stop.is_set():
+        connection = None
+        try:
+            connection = engine.raw_connection()
+            connection.detach()
+            connection.driver_connection.autocommit = True
+
+            cursor = connection.cursor()
+            cursor.execute(f"LISTEN {CHANNEL}")
+            cursor.close()
+
+            # Anything this worker cached while the listener was not connected may have missed its
+            # notification. A shared Redis cache is left alone, clearing it would empty it for
+            # every worker whenever one of them starts.
+            for item in cache.CACHES:
+                if isinstance(item, cache.MemoryBackend):
+                    item.clear()
+
+            while not stop.is_set():
+                if select.select([connection.driver_connection], [], [], 1.0) == ([], [], []):
+                    continue
+
+                connection.driver_connection.poll()
+                while connection.driver_connection.notifies:
+                    apply(connection.driver_connection.notifies.pop(0).payload)
+        except Exception:
+            logger.exception("cache invalidation listener failed, reconnecting")
+            stop.wait(settings.CACHE_LISTEN_RETRY)
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+def start() -> threading.Event:
+    stop = threading.Event()
+    threading.Thread(target=listen, args=(stop,), name="cache-invalidation", daemon=True).start()
+    return stop
@@ -0,0 +1,153 @@
+"""
+Bulk loader for seeding the catalogue from CSV or NDJSON files.
+
+    python -m dbs_assignment.load --users users.csv --authors authors.ndjson --instances instances.csv
+
+Every file is streamed into a temporary staging table with COPY and then merged into
+its table with INSERT ... ON CONFLICT DO NOTHING, so rows that already exist are skipped
+and reruns are safe. Files are loaded in foreign key order. CSV files need a header row
+naming the columns, NDJSON files hold one object per line keyed by column name.
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from pathlib import Path
+
+from sqlalchemy import column, select, table as table_clause
+
+import dbs_assignment.models as models
+from dbs_assignment import search
+from dbs_assignment.database import engine
+
+# load order follows the foreign keys
+ENTITIES = {
+    "users": models.User.__table__,
+    "authors": models.Author.__table__,
+    "categories": models.Category.__table__,
+    "publications": models.Publication.__table__,
+    "publication_authors": models.publication_authors,
+    "publication_categories": models.publication_categories,
+    "instances": models.Instance.__table__,
+}
+
+TIMESTAMPS = ("created_at", "updated_at")
+# filled in by the database rather than by the file
+DERIVED = ("search_names",)
+# loading these changes the names publications are searched by
+LINK_TABLES = ("publication_authors", "publication_categories")
+NULL = "\\N"
+
+
+class NdjsonAsCsv:
+    # file-like object COPY can read from, converting NDJSON lines to CSV rows on demand
+    def __init__(self, file, columns):
+        self.file = file
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            line = self.file.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            row = json.loads(line)
+            self.writer.writerow([NULL if row.get(column) is None else row[column] for column in self.columns])
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+        if size < 0:
+            size = len(self.pending)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+def load(connection, entity: str, file, format: str):
+    # returns (staged rows, inserted rows); the caller owns the transaction
+    table = ENTITIES[entity]
+    table_columns = [column.name for column in table.columns if column.computed is None and column.name not in DERIVED]
+
+    if format == "csv":
+        columns = next(csv.reader([file.readline()]))
+        unknown = set(columns) - set(table_columns)
+        if unknown:
+            raise ValueError(f"{entity}: unknown columns {', '.join(sorted(unknown))}")
+        source, options = file, "FORMAT csv"
+    else:
+        columns = table_columns
+        source, options = NdjsonAsCsv(file, columns), f"FORMAT csv, NULL '{NULL}'"
+
+    stage = f"stage_{table.name}"
+    column_list = ", ".join(columns)
+
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP")
+    cursor.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN WITH ({options})", source)
+    staged = cursor.rowcount
+
+    # rows without timestamps get the load time instead of NULL
+    target = columns + [name for name in TIMESTAMPS if name in table_columns and name not in columns]
+    values = [
+        f"COALESCE({name}, timezone('utc', now()))" if name in TIMESTAMPS else name
+        for name in target
+    ]
+    cursor.execute(
+        f"INSERT INTO {table.name} ({', '.join(target)}) "
+        f"SELECT {', '.join(values)} FROM {stage} "
+        f"ON CONFLICT DO NOTHING"
+    )
+    inserted = cursor.rowcount
+
+    if entity in LINK_TABLES:
+        refresh = search.refresh_statement(select(table_clause(stage, column("publication_id")).c.publication_id))
+        cursor.execute(str(refresh.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})))
+    cursor.close()
+
+    return staged, inserted
+
+
+def file_format(path: Path) -> str:
+    if path.suffix == ".csv":
+        return "csv"
+    if path.suffix in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise ValueError(f"{path}: expected a .csv, .ndjson or .jsonl file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for entity in ENTITIES:
+        parser.add_argument(f"--{entity.replace('_', '-')}", dest=entity, type=Path, metavar="FILE")
+    args = parser.parse_args()
+
+    files = [(entity, getattr(args, entity)) for entity in ENTITIES if getattr(args, entity)]
+    if not files:
+        parser.error("nothing to load")
+
+    connection = engine.raw_connection()
+    try:
+        for entity, path in files:
+            start = time.perf_counter()
+            with open(path, newline="", encoding="utf-8") as file:
+                staged, inserted = load(connection, entity, file, file_format(path))
+            connection.commit()
+            elapsed = time.perf_counter() - start
+
+            print(f"{entity}: {staged} rows read, {inserted} inserted, {staged - inserted} skipped "
+                  f"in {elapsed:.2f}s ({staged / elapsed if elapsed else staged:.0f} rows/s)")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+
+from dbs_assignment.config import settings
+
+EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+# parameters whose name contains one of these are never logged
+REDACT = [name.strip() for name in settings.LOG_REDACT.split(",") if name.strip()]
+REDACTED = "***"
+# rows of an executemany written to the log
+LOGGED_ROWS = 5
+
+sql_logger = logging.getLogger("dbs_assignment.sql")
+
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line, fields passed with extra={"fields": {...}} are merged in
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def setup():
+    # Records are put on a queue by the request threads and written to stdout by the
+    # listener's own thread, so a slow stdout never blocks a request.
+    global listener
+    if listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger("dbs_assignment")
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.propagate = False
+
+
+def redact_value(key, value):
+    if key is not None and any(name in str(key) for name in REDACT):
+        return REDACTED
+    if isinstance(value, str) and (key is None or EMAIL.search(value)):
+        # positional parameters carry no column name, none of their strings is logged
+        return REDACTED
+
+    return value
+
+
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return {key: redact_value(key, value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return [redact(row) for row in parameters[:LOGGED_ROWS]]
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(None, value) for value in parameters]
+
+    return parameters
+
+
+def log_query(cursor, statement, parameters, executemany: bool, elapsed: float):
+    # Observer of metrics.instrument. Statements slower than LOG_SLOW_QUERY_MS are always logged
+    # as warnings, the rest only for a LOG_SQL_SAMPLE_RATE fraction of statements. Unlogged
+    # statements cost a random number.
+    elapsed_ms = elapsed * 1000
+
+    if elapsed_ms >= settings.LOG_SLOW_QUERY_MS:
+        level, message = logging.WARNING, "slow query"
+    elif settings.LOG_SQL_SAMPLE_RATE and random.random() < settings.LOG_SQL_SAMPLE_RATE:
+        level, message = logging.INFO, "query"
+    else:
+        return
+
+    if not sql_logger.isEnabledFor(level):
+        return
+
+    fields = {
+        "statement": statement,
+        "parameters": redact(parameters),
+        "duration_ms": round(elapsed_ms, 3),
+        "rowcount": cursor.rowcount,
+    }
+    if executemany:
+        fields["rows"] = len(parameters)
+
+    sql_logger.log(level, message, extra={"fields": fields})
@@ -0,0 +1,56 @@
+import uuid
+from typing import List
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy import any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from dbs_assignment.config import settings
+
+
+def parse_id(id, detail: str) -> uuid.UUID:
+    # ids that are not valid UUIDs can not exist
+    try:
+        return id if isinstance(id, uuid.UUID) else uuid.UUID(str(id))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+def get_or_404(db: Session, model, id, detail: str):
+    # Primary key lookup through Session.get: a row already in the identity map costs no query,
+    # otherwise it is a single SELECT by id.
+    item = db.get(model, parse_id(id, detail))
+    if item is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+    return item
+
+
+class BatchGet(BaseModel):
+    ids: List[str] = Field(..., max_items=settings.BATCH_GET_MAX)
+
+
+def get_many(db: Session, model, ids: list, *options) -> dict:
+    # All rows in one SELECT ... WHERE id = ANY(:ids), the array is a single parameter so the
+    # statement is the same for any number of ids. Items come back in the order of ids, without
+    # repeats, and ids that are not valid UUIDs or match no row are listed as missing.
+    keys = {}
+    missing = []
+    for id in ids:
+        try:
+            keys.setdefault(uuid.UUID(str(id)), id)
+        except ValueError:
+            missing.append(id)
+
+    rows = {}
+    if keys:
+        rows = {item.id: item for item in db.scalars(
+            select(model).where(model.id == any_(bindparam("ids", list(keys), type_=ARRAY(model.id.type)))).options(*options)
+        )}
+
+    return {
+        "items": [rows[key] for key in keys if key in rows],
+        "missing": missing + [id for key, id in keys.items() if key not in rows],
+    }
@@ -0,0 +1,207 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from starlette.routing import Route
+from sqlalchemy import event
+
+from dbs_assignment import cache
+from dbs_assignment.config import settings
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# statements per request
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Stats of the request being handled. Handlers run in the threadpool with a copy of this
+# context, so the cursor hooks below see the same RequestStats object as the middleware.
+current = contextvars.ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # per bucket counts, sum, count
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, labels))
+                cumulative = 0
+                for bucket, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bucket}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: tuple):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels: tuple, value: float = 1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+
+        with self.lock:
+            for labels, total in sorted(self.series.items()):
+                label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, labels))
+                lines.append(f"{self.name}{{{label_text}}} {total}")
+
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time spent handling the request, database time included.",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL statements per request.",
+    ("method", "route"), LATENCY_BUCKETS
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request.",
+    ("method", "route"), QUERY_BUCKETS
+)
+
+# background jobs of dbs_assignment.sweeper, when it runs inside the app
+SWEEP_SECONDS = Histogram(
+    "sweeper_duration_seconds", "Time spent by one run of a sweeper job.",
+    ("job",), LATENCY_BUCKETS
+)
+SWEEP_ROWS = Counter("sweeper_rows_total", "Rows changed by the sweeper jobs.", ("job",))
+
+HISTOGRAMS = [REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, SWEEP_SECONDS]
+COUNTERS = [SWEEP_ROWS]
+
+
+def instrument(engine, *observers):
+    # Times every statement sent on the engine's connections around the DBAPI call, counts it
+    # for the request and passes it on to observer(cursor, statement, parameters, executemany, elapsed).
+    # This is the only timing hook, logging is one of the observers.
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+        stats = current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+        for observer in observers:
+            observer(cursor, statement, parameters, executemany, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # a statement that raised never reaches after_cursor_execute, its start must not stay behind
+        if exception_context.connection is None or exception_context.execution_context is None:
+            return
+        starts = exception_context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, it does not buffer responses. Routes are labelled with their path
+    # template, requests that matched no route share one label.
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.METRICS_QUERY_HEADER:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(stats.queries).encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            elapsed = time.perf_counter() - start
+            current.reset(token)
+
+            route = self.route_path(scope)
+            REQUEST_SECONDS.observe((scope["method"], route, str(status_code)), elapsed)
+            DB_SECONDS.observe((scope["method"], route), stats.db_time)
+            DB_QUERIES.observe((scope["method"], route), stats.queries)
+
+    def route_path(self, scope) -> str:
+        # the router leaves the matched endpoint in the scope
+        if self.route_paths is None:
+            self.route_paths = {
+                route.endpoint: route.path for route in scope["app"].router.routes if isinstance(route, Route)
+            }
+
+        return self.route_paths.get(scope.get("endpoint"), "unmatched")
+
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for counter in COUNTERS:
+        lines.extend(counter.render())
+
+    for counter in ("hits", "misses", "evictions", "expirations"):
+        lines.append(f"# TYPE cache_{counter}_total counter")
+        for item in cache.CACHES:
+            value = item.stats().get(counter)
+            if value is not None:
+                lines.append(f'cache_{counter}_total{{cache="{item.name}"}} {value}')
+
+    return "\n".join(lines) + "\n"
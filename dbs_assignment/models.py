@@ -1,15 +1,35 @@
 from dbs_assignment.database import Base
-from sqlalchemy import String, Column, UUID, DateTime, Date, Enum, Integer, Table, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, String, Text, Column, UUID, DateTime, Date, Enum, Integer, Table, ForeignKey, Index, PrimaryKeyConstraint, Computed, DDL, event, func, text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy_utils import EmailType
 import uuid
-import datetime
 import enum
 
 
+def utc_now():
+    # Evaluated by Postgres, not once when the worker imports this module. now() is the start of
+    # the transaction, which for a request is its first statement, so rows written by one
+    # request share a time. Models map with eager_defaults, so the values come back with
+    # INSERT/UPDATE ... RETURNING.
+    return func.timezone('utc', func.now())
+
+
+def trigram_index(name, column):
+    return Index(name, column, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+# trigram indexes need the extension before the tables are created
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
 class User(Base):
     __tablename__ = 'users'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     name = Column(String(255), nullable=False)
     surname = Column(String(255), nullable=False)
     email = Column(EmailType, nullable=False, unique=True)
@@ -18,91 +38,281 @@ class User(Base):
     personal_identificator = Column(String, nullable=False)
     reservations = relationship('Reservation', back_populates='user')
     rentals = relationship('Rental', back_populates='user')
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
 
 class Card(Base):
     __tablename__ = 'cards'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
+    __table_args__ = (
+        Index('ix_cards_created_at_id', 'created_at', 'id'),
+        Index('ix_cards_user_id', 'user_id'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     magstripe = Column(String(255), nullable=False)
     status = Column(Enum('active', 'inactive', 'expired', name='enum'), nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
 
 
 publication_authors = Table(
     'publication_authors',
     Base.metadata,
-    Column('author_id', ForeignKey('authors.id')),
-    Column('publication_id', ForeignKey('publications.id'))
+    Column('author_id', ForeignKey('authors.id'), nullable=False),
+    Column('publication_id', ForeignKey('publications.id'), nullable=False),
+    PrimaryKeyConstraint('publication_id', 'author_id'),
+    Index('ix_publication_authors_author_id', 'author_id')
 )
 
 publication_categories = Table(
     'publication_categories',
     Base.metadata,
-    Column('category_id', ForeignKey('categories.id')),
-    Column('publication_id', ForeignKey('publications.id'))
+    Column('category_id', ForeignKey('categories.id'), nullable=False),
+    Column('publication_id', ForeignKey('publications.id'), nullable=False),
+    PrimaryKeyConstraint('publication_id', 'category_id'),
+    Index('ix_publication_categories_category_id', 'category_id')
 )
 
 class Author(Base):
     __tablename__ = 'authors'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_authors_name_surname', 'name', 'surname'),
+        Index('ix_authors_created_at_id', 'created_at', 'id'),
+        Index('ix_authors_search_vector', 'search_vector', postgresql_using='gin'),
+        trigram_index('ix_authors_full_name_trgm', 'full_name'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     name = Column(String(255), nullable=False)
     surname = Column(String(255), nullable=False)
+    full_name = deferred(Column(Text, Computed("name || ' ' || surname", persisted=True)))
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', name || ' ' || surname)", persisted=True)))
     publications = relationship('Publication', secondary=publication_authors, back_populates='authors')
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
 
 class Category(Base):
     __tablename__ = 'categories'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
-    name = Column(String(255), nullable=False)
+    __table_args__ = (
+        Index('ix_categories_created_at_id', 'created_at', 'id'),
+        Index('ix_categories_search_vector', 'search_vector', postgresql_using='gin'),
+        trigram_index('ix_categories_name_trgm', 'name'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
+    name = Column(String(255), nullable=False, index=True, unique=True)
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', name)", persisted=True)))
     publications = relationship('Publication', secondary=publication_categories, back_populates='categories')
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
 
 class Publication(Base):
     __tablename__ = 'publications'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_publications_created_at_id', 'created_at', 'id'),
+        Index('ix_publications_search_vector', 'search_vector', postgresql_using='gin'),
+        trigram_index('ix_publications_search_document_trgm', 'search_document'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     title = Column(String(255), nullable=False)
+    # Names of the authors and categories, written by the routers whenever they change
+    # (dbs_assignment/search.py). Title and names are searched as one document, title ranked higher.
+    search_names = deferred(Column(Text, nullable=False, default='', server_default=''))
+    search_document = deferred(Column(Text, Computed("title || ' ' || search_names", persisted=True)))
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', search_names), 'B')", persisted=True
+    )))
     authors = relationship('Author', secondary=publication_authors, back_populates='publications')
     categories = relationship('Category', secondary=publication_categories, back_populates='publications')
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
 
 class Instance(Base):
     __tablename__ = 'instances'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_instances_created_at_id', 'created_at', 'id'),
+        Index('ix_instances_publication_id_status', 'publication_id', 'status'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     type = Column(Enum('physical', 'audiobook', 'ebook', name='type'), nullable=False)
     publisher = Column(String(255), nullable=False)
     year = Column(Integer, nullable=False)
     status = Column(Enum('available', 'reserved', 'unavailable', name='status'), nullable=False)
     publication_id = Column(UUID(as_uuid=True), ForeignKey('publications.id'), nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow(), onupdate=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
+
+class PublicationAvailability(Base):
+    # copies of a publication per instance type and status, kept up to date by a trigger on instances
+    __tablename__ = 'publication_availability'
+    publication_id = Column(UUID(as_uuid=True), ForeignKey('publications.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    physical_available = Column(Integer, nullable=False, default=0, server_default='0')
+    physical_reserved = Column(Integer, nullable=False, default=0, server_default='0')
+    physical_unavailable = Column(Integer, nullable=False, default=0, server_default='0')
+    ebook_available = Column(Integer, nullable=False, default=0, server_default='0')
+    ebook_reserved = Column(Integer, nullable=False, default=0, server_default='0')
+    ebook_unavailable = Column(Integer, nullable=False, default=0, server_default='0')
+    audiobook_available = Column(Integer, nullable=False, default=0, server_default='0')
+    audiobook_reserved = Column(Integer, nullable=False, default=0, server_default='0')
+    audiobook_unavailable = Column(Integer, nullable=False, default=0, server_default='0')
 
 class Reservation(Base):
     __tablename__ = 'reservations'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_reservations_created_at_id', 'created_at', 'id'),
+        Index('ix_reservations_publication_id_created_at', 'publication_id', 'created_at', 'id'),
+        Index('ix_reservations_user_id', 'user_id'),
+        Index('ix_reservations_publication_id_position', 'publication_id', 'position'),
+        Index('ix_reservations_hold_expires_at', 'hold_expires_at', postgresql_where=text("hold_expires_at IS NOT NULL")),
+        Index('ix_reservations_hold_instance_id', 'hold_instance_id', postgresql_where=text("hold_instance_id IS NOT NULL")),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     publication_id = Column(UUID(as_uuid=True), ForeignKey('publications.id'), nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
+    # place in the publication's queue, maintained by dbs_assignment.reservation_queue
+    position = Column(Integer, nullable=False)
+    # copy set aside for the head of the queue until hold_expires_at, see reservation_queue.place_holds
+    # both are cleared when the held copy is deleted (migration 0011)
+    hold_instance_id = Column(UUID(as_uuid=True), ForeignKey('instances.id', ondelete='SET NULL'), nullable=True)
+    hold_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=utc_now())
     user = relationship('User', back_populates='reservations')
 
+class IdempotencyKey(Base):
+    # responses of POST requests sent with an Idempotency-Key header, see dbs_assignment/idempotency.py
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+    scope = Column(String(64), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    body = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, server_default=utc_now())
+
+class NotificationOutbox(Base):
+    # events written in the transaction that caused them, delivered later by dbs_assignment.outbox
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        Index('ix_notification_outbox_pending', 'id', postgresql_where=text("processed_at IS NULL")),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event = Column(String(64), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, server_default=utc_now())
+    processed_at = Column(DateTime, nullable=True)
+
 class Rental(Base):
     __tablename__ = 'rentals'
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, unique=True, nullable=False, autoincrement=False)
+    __table_args__ = (
+        Index('ix_rentals_created_at_id', 'created_at', 'id'),
+        Index('ix_rentals_user_id_created_at', 'user_id', 'created_at', 'id'),
+        Index('ix_rentals_publication_instance_id', 'publication_instance_id'),
+        # the sweeper's overdue scan only reads rentals that are still active
+        Index('ix_rentals_active_end_date', 'end_date', postgresql_where=text("status = 'active'")),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, autoincrement=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     publication_instance_id = Column(UUID(as_uuid=True), ForeignKey('instances.id'), nullable=False)
     duration = Column(Integer, nullable=False)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
     status = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow())
+    created_at = Column(DateTime, server_default=utc_now())
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now())
     user = relationship('User', back_populates='rentals')
 
 
+# Triggers of a database created from these models (create_db.py). Databases created
+# earlier get them from the migrations named next to each.
+
+# 0003
+AVAILABILITY_TRIGGER = """
+    CREATE OR REPLACE FUNCTION publication_availability_count() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.type = NEW.type AND OLD.status = NEW.status
+                AND OLD.publication_id = NEW.publication_id THEN
+            RETURN NULL;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            EXECUTE format('UPDATE publication_availability SET %1$I = %1$I - 1 WHERE publication_id = $1',
+                           OLD.type::text || '_' || OLD.status::text)
+            USING OLD.publication_id;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO publication_availability (publication_id) VALUES (NEW.publication_id)
+            ON CONFLICT (publication_id) DO NOTHING;
+            EXECUTE format('UPDATE publication_availability SET %1$I = %1$I + 1 WHERE publication_id = $1',
+                           NEW.type::text || '_' || NEW.status::text)
+            USING NEW.publication_id;
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER instances_availability
+    AFTER INSERT OR DELETE OR UPDATE OF type, status, publication_id ON instances
+    FOR EACH ROW EXECUTE FUNCTION publication_availability_count();
+"""
+
+# 0004, payload from 0012
+CACHE_INVALIDATION_TRIGGER = """
+    CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+    DECLARE
+        keys json;
+    BEGIN
+        IF TG_TABLE_NAME = 'authors' THEN
+            keys := json_build_object('id', OLD.id, 'name', OLD.name, 'surname', OLD.surname);
+        ELSIF TG_TABLE_NAME = 'categories' THEN
+            keys := json_build_object('id', OLD.id, 'name', OLD.name);
+        ELSE
+            keys := json_build_object('id', OLD.id);
+        END IF;
+
+        PERFORM pg_notify('cache_invalidation', json_build_object('table', TG_TABLE_NAME, 'row', keys)::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+""" + "".join(f"""
+    CREATE TRIGGER {table}_cache_invalidation
+    AFTER UPDATE OR DELETE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
+""" for table in ('authors', 'categories', 'publications'))
+
+# 0011
+RELEASE_HOLD_TRIGGER = """
+    CREATE OR REPLACE FUNCTION release_deleted_hold() RETURNS trigger AS $$
+    BEGIN
+        UPDATE reservations SET hold_instance_id = NULL, hold_expires_at = NULL
+        WHERE hold_instance_id = OLD.id;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER instances_release_hold
+    BEFORE DELETE ON instances
+    FOR EACH ROW EXECUTE FUNCTION release_deleted_hold();
+"""
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_triggers(target, connection, **kw):
+    # sent as is, without parameters, since the function bodies contain % and $ characters
+    for trigger in (AVAILABILITY_TRIGGER, CACHE_INVALIDATION_TRIGGER, RELEASE_HOLD_TRIGGER):
+        connection.exec_driver_sql(trigger, execution_options={"no_parameters": True})
+
+
+
 
 
 
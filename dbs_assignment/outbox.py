@@ -0,0 +1,62 @@
+import logging
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+from dbs_assignment.config import settings
+
+# Notifications are written to notification_outbox in the transaction that caused them and
+# delivered by the sweeper afterwards, so an event exists exactly when its change committed.
+# Delivery is at least once: a batch that fails is left pending and retried on the next run.
+
+logger = logging.getLogger("dbs_assignment.notifications")
+
+
+def log_event(event: str, payload: dict):
+    # nothing sends mail yet, the event is written to the JSON log for whatever ships it on
+    logger.info(event, extra={"fields": {"event": event, **payload}})
+
+
+# event: handler(event, payload)
+HANDLERS = {
+    "reservation.hold_placed": log_event,
+    "reservation.hold_expired": log_event,
+}
+
+
+def deliver(db: Session, batch_size: int) -> int:
+    # oldest pending events first, skipping those another sweeper is delivering
+    events = db.execute(
+        select(models.NotificationOutbox.id, models.NotificationOutbox.event, models.NotificationOutbox.payload)
+        .where(models.NotificationOutbox.processed_at.is_(None))
+        .order_by(models.NotificationOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for event in events:
+        HANDLERS.get(event.event, log_event)(event.event, event.payload)
+
+    if events:
+        db.execute(
+            update(models.NotificationOutbox)
+            .where(models.NotificationOutbox.id.in_([event.id for event in events]))
+            .values(processed_at=models.utc_now())
+            .execution_options(synchronize_session=False)
+        )
+
+    return len(events)
+
+
+def purge(db: Session, batch_size: int) -> int:
+    # delivered events older than OUTBOX_RETENTION_DAYS
+    old = select(models.NotificationOutbox.id).where(
+        models.NotificationOutbox.processed_at < models.utc_now() - func.make_interval(0, 0, 0, settings.OUTBOX_RETENTION_DAYS)
+    ).limit(batch_size).with_for_update(skip_locked=True)
+
+    return db.execute(
+        delete(models.NotificationOutbox)
+        .where(models.NotificationOutbox.id.in_(old))
+        .execution_options(synchronize_session=False)
+    ).rowcount
@@ -0,0 +1,44 @@
+import base64
+import datetime
+import uuid
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import tuple_
+
+from dbs_assignment.config import settings
+
+
+def page_size(limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)) -> int:
+    return limit
+
+
+def encode_cursor(created_at: datetime.datetime, id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def filter_by(query, **filters):
+    return query.filter_by(**{column: value for column, value in filters.items() if value is not None})
+
+
+def paginate(query, model, cursor: str, limit: int) -> dict:
+    # Keyset pagination on (created_at, id): a page is an index range scan starting right after
+    # the cursor, so deep pages cost the same as the first one, unlike OFFSET.
+    if cursor:
+        query = query.filter(tuple_(model.created_at, model.id) > decode_cursor(cursor))
+
+    items = query.order_by(model.created_at, model.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+
+    return {"items": items, "next_cursor": next_cursor}
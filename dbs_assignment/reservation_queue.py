@@ -0,0 +1,171 @@
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+from dbs_assignment.config import settings
+
+# Every publication has its own queue of reservations. A reservation keeps its place in
+# reservations.position (1 is the head), so looking a place up is a single index read
+# instead of walking the queue. Changes to a queue are serialized on the publication row.
+#
+# When a copy is free and people are waiting, the sweeper holds it for the first of them who has
+# no hold yet: the copy becomes reserved and the reservation gets hold_instance_id and a
+# hold_expires_at deadline. Holds are given in queue order and end with the reservation, so
+# the held reservations are always the first places of the queue.
+
+
+def lock(db: Session, publication_id):
+    db.execute(select(models.Publication.id).where(models.Publication.id == publication_id).with_for_update())
+
+
+def length(db: Session, publication_id) -> int:
+    return db.scalar(
+        select(func.coalesce(func.max(models.Reservation.position), 0))
+        .where(models.Reservation.publication_id == publication_id)
+    )
+
+
+def position(db: Session, publication_id, user_id):
+    return db.scalar(
+        select(func.min(models.Reservation.position))
+        .where(models.Reservation.publication_id == publication_id, models.Reservation.user_id == user_id)
+    )
+
+
+def enqueue(db: Session, reservation: models.Reservation):
+    # added first so it is in the session, but only flushed once its position is known
+    db.add(reservation)
+    with db.no_autoflush:
+        lock(db, reservation.publication_id)
+        reservation.position = length(db, reservation.publication_id) + 1
+
+
+def remove(db: Session, reservation: models.Reservation):
+    # everyone behind the removed reservation moves one place up
+    lock(db, reservation.publication_id)
+    current = db.scalar(select(models.Reservation.position).where(models.Reservation.id == reservation.id))
+
+    if reservation.hold_instance_id is not None:
+        # a copy still held for the reservation is free again, a rented one is already unavailable
+        db.execute(
+            update(models.Instance)
+            .where(models.Instance.id == reservation.hold_instance_id, models.Instance.status == "reserved")
+            .values(status="available")
+            .execution_options(synchronize_session=False)
+        )
+
+    db.delete(reservation)
+    db.flush()
+    db.execute(
+        update(models.Reservation)
+        .where(models.Reservation.publication_id == reservation.publication_id, models.Reservation.position > current)
+        .values(position=models.Reservation.position - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def promote(db: Session, publication_id, user_id):
+    # a queued user who got a copy leaves the queue, which moves the people behind them up
+    reservation = db.query(models.Reservation).filter(
+        models.Reservation.publication_id == publication_id,
+        models.Reservation.user_id == user_id
+    ).order_by(models.Reservation.position).first()
+
+    if reservation:
+        remove(db, reservation)
+
+
+def holds(db: Session, publication_id):
+    # held reservations as a subquery, they take up the first places of the queue
+    return select(func.count()).where(
+        models.Reservation.publication_id == publication_id,
+        models.Reservation.hold_instance_id.is_not(None)
+    ).scalar_subquery()
+
+
+# Both jobs take a batch of publications whose rows are free, locking them like any other queue
+# change, and handle all of their queues in one statement. Every hold placed or expired is
+# written to the notification outbox in the same transaction.
+
+PLACE_HOLDS = text("""
+    WITH queues AS (
+        SELECT p.id FROM publications p
+        WHERE p.id IN (SELECT r.publication_id FROM reservations r WHERE r.hold_instance_id IS NULL)
+          AND EXISTS (SELECT 1 FROM instances i WHERE i.publication_id = p.id AND i.status = 'available')
+        LIMIT :batch_size
+        FOR UPDATE OF p SKIP LOCKED
+    ), copies AS (
+        -- Free copies are locked before they are paired, so every pair below can be taken and
+        -- holds go out in queue order. Copies a rental is taking right now are left out.
+        SELECT i.id, i.publication_id
+        FROM instances i JOIN queues q ON q.id = i.publication_id
+        WHERE i.status = 'available'
+        FOR UPDATE OF i SKIP LOCKED
+    ), free AS (
+        SELECT id, publication_id, row_number() OVER (PARTITION BY publication_id ORDER BY id) AS n
+        FROM copies
+    ), waiting AS (
+        SELECT r.id, r.publication_id, row_number() OVER (PARTITION BY r.publication_id ORDER BY r.position) AS n
+        FROM reservations r JOIN queues q ON q.id = r.publication_id
+        WHERE r.hold_instance_id IS NULL
+    ), pairs AS (
+        SELECT waiting.id AS reservation_id, free.id AS instance_id
+        FROM waiting JOIN free ON free.publication_id = waiting.publication_id AND free.n = waiting.n
+    ), taken AS (
+        UPDATE instances i SET status = 'reserved', updated_at = timezone('utc', now())
+        FROM pairs WHERE i.id = pairs.instance_id
+        RETURNING i.id
+    ), held AS (
+        UPDATE reservations r
+        SET hold_instance_id = pairs.instance_id,
+            hold_expires_at = timezone('utc', now()) + make_interval(hours => :hold_hours)
+        FROM pairs
+        WHERE r.id = pairs.reservation_id
+        RETURNING r.id, r.user_id, r.publication_id, r.hold_instance_id, r.hold_expires_at
+    )
+    INSERT INTO notification_outbox (event, payload)
+    SELECT 'reservation.hold_placed', json_build_object(
+        'reservation_id', id, 'user_id', user_id, 'publication_id', publication_id,
+        'instance_id', hold_instance_id, 'expires_at', hold_expires_at
+    ) FROM held
+""")
+
+EXPIRE_HOLDS = text("""
+    WITH expired AS (
+        SELECT r.id, r.user_id, r.publication_id, r.position, r.hold_instance_id
+        FROM reservations r JOIN publications p ON p.id = r.publication_id
+        WHERE r.hold_expires_at < timezone('utc', now()) AND r.hold_instance_id IS NOT NULL
+        LIMIT :batch_size
+        FOR UPDATE OF p, r SKIP LOCKED
+    ), released AS (
+        -- the copy goes back to available, the next run of place_holds gives it to the next in line
+        UPDATE instances i SET status = 'available', updated_at = timezone('utc', now())
+        FROM expired WHERE i.id = expired.hold_instance_id AND i.status = 'reserved'
+        RETURNING i.id
+    ), removed AS (
+        DELETE FROM reservations r USING expired WHERE r.id = expired.id
+        RETURNING r.id
+    ), moved AS (
+        -- everyone behind an expired reservation moves up by the number of expired places before them
+        UPDATE reservations r SET position = r.position - (
+            SELECT count(*) FROM expired e WHERE e.publication_id = r.publication_id AND e.position < r.position
+        )
+        WHERE r.publication_id IN (SELECT publication_id FROM expired)
+          AND r.id NOT IN (SELECT id FROM expired)
+        RETURNING r.id
+    )
+    INSERT INTO notification_outbox (event, payload)
+    SELECT 'reservation.hold_expired', json_build_object(
+        'reservation_id', id, 'user_id', user_id, 'publication_id', publication_id, 'instance_id', hold_instance_id
+    ) FROM expired
+""")
+
+
+def place_holds(db: Session, batch_size: int) -> int:
+    # returns the number of holds placed
+    return db.execute(PLACE_HOLDS, {"batch_size": batch_size, "hold_hours": settings.RESERVATION_HOLD_HOURS}).rowcount
+
+
+def expire_holds(db: Session, batch_size: int) -> int:
+    # returns the number of reservations removed
+    return db.execute(EXPIRE_HOLDS, {"batch_size": batch_size}).rowcount
@@ -1,14 +1,27 @@
 from fastapi import APIRouter
 
-from dbs_assignment.endpoints import users, cards, publications, authors, categories, instances, reservations, rentals
+from dbs_assignment.config import settings
+from dbs_assignment.endpoints import users, cards, publications, authors, categories, instances, reservations, rentals, export, stats, search
 
 router = APIRouter()
 
-router.include_router(users.router, tags=["users"])
-router.include_router(cards.router, tags=["cards"])
-router.include_router(publications.router, tags=["publications"])
-router.include_router(authors.router, tags=["authors"])
-router.include_router(categories.router, tags=["categories"])
-router.include_router(instances.router, tags=['instances'])
-router.include_router(reservations.router, tags=['reservations'])
-router.include_router(rentals.router, tags=["rentals"])
+
+def runtime(endpoint_router: APIRouter) -> APIRouter:
+    if settings.DB_ASYNC:
+        from dbs_assignment.async_router import make_async
+        return make_async(endpoint_router)
+
+    return endpoint_router
+
+
+router.include_router(runtime(users.router), tags=["users"])
+router.include_router(runtime(cards.router), tags=["cards"])
+router.include_router(runtime(publications.router), tags=["publications"])
+router.include_router(runtime(authors.router), tags=["authors"])
+router.include_router(runtime(categories.router), tags=["categories"])
+router.include_router(runtime(instances.router), tags=['instances'])
+router.include_router(runtime(reservations.router), tags=['reservations'])
+router.include_router(runtime(rentals.router), tags=["rentals"])
+router.include_router(runtime(export.router), tags=["export"])
+router.include_router(runtime(search.router), tags=["search"])
+router.include_router(runtime(stats.router), tags=["stats"])
@@ -0,0 +1,35 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+
+
+def names(authors: list, categories: list) -> str:
+    # search_names of a publication whose authors and categories are at hand
+    return " ".join([f"{author.name} {author.surname}" for author in authors] + [category.name for category in categories])
+
+
+def refresh_statement(publication_ids):
+    # Rebuilds search_names from the link tables and moves updated_at, as the publications embed
+    # these names in their responses. publication_ids is a list or a SELECT of ids.
+    authors = select(func.string_agg(models.Author.name + " " + models.Author.surname, " ")).select_from(
+        models.publication_authors.join(models.Author)
+    ).where(models.publication_authors.c.publication_id == models.Publication.id).scalar_subquery()
+    categories = select(func.string_agg(models.Category.name, " ")).select_from(
+        models.publication_categories.join(models.Category)
+    ).where(models.publication_categories.c.publication_id == models.Publication.id).scalar_subquery()
+
+    return update(models.Publication).where(models.Publication.id.in_(publication_ids)).values(
+        search_names=func.concat_ws(" ", authors, categories),
+        updated_at=models.utc_now()
+    )
+
+
+def linked_publications(db: Session, link_column, id) -> list:
+    # ids of the publications an author or category belongs to, read before it changes
+    return db.scalars(select(link_column.table.c.publication_id).where(link_column == id)).all()
+
+
+def refresh_publications(db: Session, publication_ids: list):
+    if publication_ids:
+        db.execute(refresh_statement(publication_ids), execution_options={"synchronize_session": False})
@@ -0,0 +1,113 @@
+"""
+Background sweeper for state that changes with time: rentals becoming overdue, copies held
+for the head of a reservation queue and holds expiring, the notifications they cause, and
+expired idempotency keys.
+
+    python -m dbs_assignment.sweeper           # a run every SWEEPER_INTERVAL seconds
+    python -m dbs_assignment.sweeper --once
+
+The app also runs it as an asyncio task in every worker unless SWEEPER_ENABLED is false.
+Each job changes its rows with set-based UPDATEs of at most SWEEPER_BATCH_SIZE rows, one
+transaction per batch, picking them with FOR UPDATE SKIP LOCKED so concurrent sweepers and
+request handlers never wait for each other. Every run logs the rows each job changed and
+how long it took, and counts them in /metrics when it runs inside the app.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+import dbs_assignment.models as models
+from dbs_assignment import idempotency, log, metrics, outbox, reservation_queue
+from dbs_assignment.config import settings
+from dbs_assignment.database import SessionLocal
+
+logger = logging.getLogger("dbs_assignment.sweeper")
+
+
+def mark_overdue(db: Session, batch_size: int) -> int:
+    # active rentals past their end date, found through ix_rentals_active_end_date
+    due = select(models.Rental.id).where(
+        models.Rental.status == "active",
+        models.Rental.end_date < func.current_date()
+    ).limit(batch_size).with_for_update(skip_locked=True)
+
+    return db.execute(
+        update(models.Rental)
+        .where(models.Rental.id.in_(due))
+        .values(status="overdue")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# name: job(db, batch_size) returning the number of rows it changed
+JOBS = {
+    "overdue_rentals": mark_overdue,
+    # expired holds first, so their copies are held for the next in line in the same run
+    "expired_holds": reservation_queue.expire_holds,
+    "holds": reservation_queue.place_holds,
+    "notifications": outbox.deliver,
+    "outbox_purge": outbox.purge,
+    "idempotency_purge": idempotency.purge,
+}
+
+
+def run_job(job, batch_size: int) -> int:
+    total = 0
+    while True:
+        with SessionLocal() as db:
+            changed = job(db, batch_size)
+            db.commit()
+
+        total += changed
+        if changed < batch_size:
+            return total
+
+
+def sweep() -> dict:
+    counts = {}
+    for name, job in JOBS.items():
+        start = time.perf_counter()
+        try:
+            counts[name] = run_job(job, settings.SWEEPER_BATCH_SIZE)
+        except Exception:
+            logger.exception("sweeper job failed", extra={"fields": {"job": name}})
+            continue
+        elapsed = time.perf_counter() - start
+
+        metrics.SWEEP_SECONDS.observe((name,), elapsed)
+        metrics.SWEEP_ROWS.inc((name,), counts[name])
+        logger.info("sweep", extra={"fields": {"job": name, "rows": counts[name], "duration_ms": round(elapsed * 1000, 3)}})
+
+    return counts
+
+
+async def run():
+    # the jobs block on the database, so they run in a thread off the event loop
+    while True:
+        await asyncio.to_thread(sweep)
+        await asyncio.sleep(settings.SWEEPER_INTERVAL)
+
+
+def start() -> asyncio.Task:
+    return asyncio.get_running_loop().create_task(run(), name="sweeper")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    args = parser.parse_args()
+
+    log.setup()
+    while True:
+        sweep()
+        if args.once:
+            return
+        time.sleep(settings.SWEEPER_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Indexes and constraints for the router query patterns
+
+Revision ID: 0001
+Revises:
+
+Databases created before migrations existed are brought up to the models with it, a
+fresh database is created from the models and stamped instead (create_db.py).
+"""
+from alembic import op
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TABLES = ['users', 'cards', 'authors', 'categories', 'publications', 'instances', 'reservations', 'rentals']
+
+INDEXES = [
+    ('ix_authors_name_surname', 'authors', 'name, surname'),
+    ('ix_cards_user_id', 'cards', 'user_id'),
+    ('ix_instances_publication_id_status', 'instances', 'publication_id, status'),
+    ('ix_reservations_publication_id_created_at', 'reservations', 'publication_id, created_at, id'),
+    ('ix_reservations_user_id', 'reservations', 'user_id'),
+    ('ix_rentals_user_id_created_at', 'rentals', 'user_id, created_at, id'),
+    ('ix_rentals_publication_instance_id', 'rentals', 'publication_instance_id'),
+    ('ix_publication_authors_author_id', 'publication_authors', 'author_id'),
+    ('ix_publication_categories_category_id', 'publication_categories', 'category_id'),
+] + [(f'ix_{table}_created_at_id', table, 'created_at, id') for table in TABLES]
+
+LINK_TABLES = [
+    ('publication_authors', 'author_id'),
+    ('publication_categories', 'category_id'),
+]
+
+
+def add_constraint(table, name, definition):
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{name}') THEN
+                ALTER TABLE {table} ADD CONSTRAINT {name} {definition};
+            END IF;
+        END $$
+    """)
+
+
+def upgrade():
+    # every primary key also had a unique index of its own
+    for table in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_id")
+
+    for name, table, columns in INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_categories_name ON categories (name)")
+
+    # existing cards are not re-checked, new and updated ones are
+    add_constraint('cards', 'cards_user_id_fkey', "FOREIGN KEY (user_id) REFERENCES users (id) NOT VALID")
+
+    # link tables get a primary key, drop the rows that would violate it first
+    for table, column in LINK_TABLES:
+        op.execute(f"DELETE FROM {table} WHERE {column} IS NULL OR publication_id IS NULL")
+        op.execute(f"""
+            DELETE FROM {table} a USING {table} b
+            WHERE a.ctid < b.ctid AND a.{column} = b.{column} AND a.publication_id = b.publication_id
+        """)
+        add_constraint(table, f'{table}_pkey', f"PRIMARY KEY (publication_id, {column})")
+
+
+def downgrade():
+    for table, column in LINK_TABLES:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_pkey")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL, ALTER COLUMN publication_id DROP NOT NULL")
+
+    op.execute("ALTER TABLE cards DROP CONSTRAINT IF EXISTS cards_user_id_fkey")
+
+    op.execute("DROP INDEX IF EXISTS ix_categories_name")
+    for name, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+    for table in TABLES:
+        op.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_id ON {table} (id)")
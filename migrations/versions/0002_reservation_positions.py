@@ -0,0 +1,33 @@
+"""Materialized place of every reservation in its publication's queue
+
+Revision ID: 0002
+Revises: 0001
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE reservations ADD COLUMN IF NOT EXISTS position integer")
+
+    # existing queues keep their created_at order
+    op.execute("""
+        UPDATE reservations r SET position = q.position
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY publication_id ORDER BY created_at, id) AS position
+            FROM reservations
+        ) q
+        WHERE r.id = q.id AND r.position IS NULL
+    """)
+    op.execute("ALTER TABLE reservations ALTER COLUMN position SET NOT NULL")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_reservations_publication_id_position ON reservations (publication_id, position)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_reservations_publication_id_position")
+    op.execute("ALTER TABLE reservations DROP COLUMN IF EXISTS position")
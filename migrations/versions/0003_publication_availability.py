@@ -0,0 +1,79 @@
+"""Availability counters per publication, maintained by a trigger on instances
+
+Revision ID: 0003
+Revises: 0002
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+TYPES = ['physical', 'ebook', 'audiobook']
+STATUSES = ['available', 'reserved', 'unavailable']
+COUNTERS = [f'{type}_{status}' for type in TYPES for status in STATUSES]
+
+
+def upgrade():
+    counters = ",\n".join(f"{counter} integer NOT NULL DEFAULT 0" for counter in COUNTERS)
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS publication_availability (
+            publication_id uuid PRIMARY KEY REFERENCES publications (id) ON DELETE CASCADE,
+            {counters}
+        )
+    """)
+
+    # Every write to instances moves one copy between counters, whichever code path did it
+    # (the routers, the bulk endpoints, the loader or rental allocation).
+    op.execute("""
+        CREATE OR REPLACE FUNCTION publication_availability_count() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.type = NEW.type AND OLD.status = NEW.status
+                    AND OLD.publication_id = NEW.publication_id THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format('UPDATE publication_availability SET %1$I = %1$I - 1 WHERE publication_id = $1',
+                               OLD.type::text || '_' || OLD.status::text)
+                USING OLD.publication_id;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO publication_availability (publication_id) VALUES (NEW.publication_id)
+                ON CONFLICT (publication_id) DO NOTHING;
+                EXECUTE format('UPDATE publication_availability SET %1$I = %1$I + 1 WHERE publication_id = $1',
+                               NEW.type::text || '_' || NEW.status::text)
+                USING NEW.publication_id;
+            END IF;
+
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS instances_availability ON instances")
+    op.execute("""
+        CREATE TRIGGER instances_availability
+        AFTER INSERT OR DELETE OR UPDATE OF type, status, publication_id ON instances
+        FOR EACH ROW EXECUTE FUNCTION publication_availability_count()
+    """)
+
+    # recount from scratch, no instance can change while the counters are filled
+    op.execute("LOCK TABLE instances IN SHARE MODE")
+    counts = ", ".join(
+        f"count(*) FILTER (WHERE type = '{counter.split('_')[0]}' AND status = '{counter.split('_')[1]}')"
+        for counter in COUNTERS
+    )
+    op.execute(f"""
+        INSERT INTO publication_availability (publication_id, {', '.join(COUNTERS)})
+        SELECT publication_id, {counts} FROM instances GROUP BY publication_id
+        ON CONFLICT (publication_id) DO UPDATE SET {', '.join(f'{counter} = EXCLUDED.{counter}' for counter in COUNTERS)}
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS instances_availability ON instances")
+    op.execute("DROP FUNCTION IF EXISTS publication_availability_count()")
+    op.execute("DROP TABLE IF EXISTS publication_availability")
@@ -0,0 +1,44 @@
+"""NOTIFY on writes to the cached catalogue tables
+
+Revision ID: 0004
+Revises: 0003
+
+Every worker LISTENs on cache_invalidation (dbs_assignment/invalidation.py) and drops
+the entries of the rows other workers, the loader or anyone else changed.
+"""
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+TABLES = ['authors', 'categories', 'publications']
+
+
+def upgrade():
+    # Only updates and deletes can leave a stale entry, inserts are new ids and names
+    # which are never cached as missing. The old row carries the keys the entry is cached under.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('cache_invalidation', json_build_object('table', TG_TABLE_NAME, 'row', row_to_json(OLD))::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_invalidation ON {table}")
+        op.execute(f"""
+            CREATE TRIGGER {table}_cache_invalidation
+            AFTER UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation()
+        """)
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_invalidation ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_cache_invalidation()")
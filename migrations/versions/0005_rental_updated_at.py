@@ -0,0 +1,21 @@
+"""updated_at on rentals, the version their ETag is derived from
+
+Revision ID: 0005
+Revises: 0004
+"""
+from alembic import op
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE rentals ADD COLUMN IF NOT EXISTS updated_at timestamp without time zone")
+    op.execute("UPDATE rentals SET updated_at = created_at WHERE updated_at IS NULL")
+
+
+def downgrade():
+    op.execute("ALTER TABLE rentals DROP COLUMN IF EXISTS updated_at")
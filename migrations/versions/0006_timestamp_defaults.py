@@ -0,0 +1,39 @@
+"""Timestamps defaulted by the database
+
+Revision ID: 0006
+Revises: 0005
+
+The models used to send a time frozen when the worker started. Now the columns default
+to the start time of the writing transaction in UTC, and updates set updated_at in the
+UPDATE itself.
+"""
+from alembic import op
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+TIMESTAMPS = [
+    ('users', ['created_at', 'updated_at']),
+    ('cards', ['created_at', 'updated_at']),
+    ('authors', ['created_at', 'updated_at']),
+    ('categories', ['created_at', 'updated_at']),
+    ('publications', ['created_at', 'updated_at']),
+    ('instances', ['created_at', 'updated_at']),
+    ('reservations', ['created_at']),
+    ('rentals', ['created_at', 'updated_at']),
+]
+
+
+def upgrade():
+    for table, columns in TIMESTAMPS:
+        op.execute(f"ALTER TABLE {table} " + ", ".join(
+            f"ALTER COLUMN {column} SET DEFAULT timezone('utc', now())" for column in columns
+        ))
+
+
+def downgrade():
+    for table, columns in TIMESTAMPS:
+        op.execute(f"ALTER TABLE {table} " + ", ".join(f"ALTER COLUMN {column} DROP DEFAULT" for column in columns))
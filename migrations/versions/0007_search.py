@@ -0,0 +1,56 @@
+"""search columns and GIN indexes on publications, authors and categories
+
+Revision ID: 0007
+Revises: 0006
+"""
+from alembic import op
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.execute("""
+        ALTER TABLE authors
+            ADD COLUMN IF NOT EXISTS full_name text GENERATED ALWAYS AS (name || ' ' || surname) STORED,
+            ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', name || ' ' || surname)) STORED
+    """)
+    op.execute("""
+        ALTER TABLE categories
+            ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', name)) STORED
+    """)
+    op.execute("ALTER TABLE publications ADD COLUMN IF NOT EXISTS search_names text NOT NULL DEFAULT ''")
+    op.execute("""
+        UPDATE publications p SET search_names = concat_ws(' ',
+            (SELECT string_agg(a.name || ' ' || a.surname, ' ') FROM publication_authors pa
+                JOIN authors a ON a.id = pa.author_id WHERE pa.publication_id = p.id),
+            (SELECT string_agg(c.name, ' ') FROM publication_categories pc
+                JOIN categories c ON c.id = pc.category_id WHERE pc.publication_id = p.id)
+        )
+    """)
+    op.execute("""
+        ALTER TABLE publications
+            ADD COLUMN IF NOT EXISTS search_document text GENERATED ALWAYS AS (title || ' ' || search_names) STORED,
+            ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', search_names), 'B')
+            ) STORED
+    """)
+
+    op.execute("CREATE INDEX IF NOT EXISTS ix_authors_search_vector ON authors USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_authors_full_name_trgm ON authors USING gin (full_name gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_categories_search_vector ON categories USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_categories_name_trgm ON categories USING gin (name gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_publications_search_vector ON publications USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_publications_search_document_trgm ON publications USING gin (search_document gin_trgm_ops)")
+
+
+def downgrade():
+    op.execute("ALTER TABLE publications DROP COLUMN IF EXISTS search_vector, DROP COLUMN IF EXISTS search_document, DROP COLUMN IF EXISTS search_names")
+    op.execute("ALTER TABLE categories DROP COLUMN IF EXISTS search_vector")
+    op.execute("ALTER TABLE authors DROP COLUMN IF EXISTS search_vector, DROP COLUMN IF EXISTS full_name")
+    op.execute("DROP INDEX IF EXISTS ix_categories_name_trgm")
@@ -0,0 +1,20 @@
+"""partial index on the end date of active rentals, read by the overdue sweeper
+
+Revision ID: 0008
+Revises: 0007
+"""
+from alembic import op
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS ix_rentals_active_end_date ON rentals (end_date) WHERE status = 'active'")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_rentals_active_end_date")
@@ -0,0 +1,41 @@
+"""holds on reservations and the notification outbox
+
+Revision ID: 0009
+Revises: 0008
+"""
+from alembic import op
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE reservations
+            ADD COLUMN IF NOT EXISTS hold_instance_id uuid REFERENCES instances (id),
+            ADD COLUMN IF NOT EXISTS hold_expires_at timestamp without time zone
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_reservations_hold_expires_at ON reservations (hold_expires_at)
+        WHERE hold_expires_at IS NOT NULL
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id bigserial PRIMARY KEY,
+            event varchar(64) NOT NULL,
+            payload jsonb NOT NULL,
+            created_at timestamp without time zone DEFAULT timezone('utc', now()),
+            processed_at timestamp without time zone
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending ON notification_outbox (id) WHERE processed_at IS NULL")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS notification_outbox")
+    op.execute("DROP INDEX IF EXISTS ix_reservations_hold_expires_at")
+    op.execute("ALTER TABLE reservations DROP COLUMN IF EXISTS hold_expires_at, DROP COLUMN IF EXISTS hold_instance_id")
@@ -0,0 +1,31 @@
+"""stored responses of POST requests sent with an Idempotency-Key header
+
+Revision ID: 0010
+Revises: 0009
+"""
+from alembic import op
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope varchar(64) NOT NULL,
+            key varchar(255) NOT NULL,
+            fingerprint varchar(64) NOT NULL,
+            status_code integer NOT NULL,
+            body jsonb NOT NULL,
+            created_at timestamp without time zone DEFAULT timezone('utc', now()),
+            PRIMARY KEY (scope, key)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS idempotency_keys")
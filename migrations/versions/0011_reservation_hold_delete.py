@@ -0,0 +1,52 @@
+"""holds end when their copy is deleted
+
+Revision ID: 0011
+Revises: 0010
+"""
+from alembic import op
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE reservations DROP CONSTRAINT IF EXISTS reservations_hold_instance_id_fkey")
+    op.execute("""
+        ALTER TABLE reservations ADD CONSTRAINT reservations_hold_instance_id_fkey
+        FOREIGN KEY (hold_instance_id) REFERENCES instances (id) ON DELETE SET NULL
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_reservations_hold_instance_id ON reservations (hold_instance_id)
+        WHERE hold_instance_id IS NOT NULL
+    """)
+
+    # the foreign key only clears hold_instance_id, the deadline of the hold goes with it
+    op.execute("""
+        CREATE OR REPLACE FUNCTION release_deleted_hold() RETURNS trigger AS $$
+        BEGIN
+            UPDATE reservations SET hold_instance_id = NULL, hold_expires_at = NULL
+            WHERE hold_instance_id = OLD.id;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS instances_release_hold ON instances")
+    op.execute("""
+        CREATE TRIGGER instances_release_hold
+        BEFORE DELETE ON instances
+        FOR EACH ROW EXECUTE FUNCTION release_deleted_hold()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS instances_release_hold ON instances")
+    op.execute("DROP FUNCTION IF EXISTS release_deleted_hold()")
+    op.execute("DROP INDEX IF EXISTS ix_reservations_hold_instance_id")
+    op.execute("ALTER TABLE reservations DROP CONSTRAINT IF EXISTS reservations_hold_instance_id_fkey")
+    op.execute("""
+        ALTER TABLE reservations ADD CONSTRAINT reservations_hold_instance_id_fkey
+        FOREIGN KEY (hold_instance_id) REFERENCES instances (id)
+    """)
@@ -0,0 +1,47 @@
+"""cache invalidation notifications carry only the keys the listener reads
+
+Revision ID: 0012
+Revises: 0011
+
+row_to_json(OLD) includes the search columns of 0007, which can take a publication's
+payload past the 8000 bytes pg_notify accepts and fail the write that fired it.
+"""
+from alembic import op
+
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+        DECLARE
+            keys json;
+        BEGIN
+            IF TG_TABLE_NAME = 'authors' THEN
+                keys := json_build_object('id', OLD.id, 'name', OLD.name, 'surname', OLD.surname);
+            ELSIF TG_TABLE_NAME = 'categories' THEN
+                keys := json_build_object('id', OLD.id, 'name', OLD.name);
+            ELSE
+                keys := json_build_object('id', OLD.id);
+            END IF;
+
+            PERFORM pg_notify('cache_invalidation', json_build_object('table', TG_TABLE_NAME, 'row', keys)::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def downgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('cache_invalidation', json_build_object('table', TG_TABLE_NAME, 'row', row_to_json(OLD))::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
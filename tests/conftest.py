@@ -0,0 +1,104 @@
+import contextlib
+import uuid
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+# The tests run against the database the DATABASE_* variables point at, which should be a
+# scratch database. The schema is created or upgraded once per session and every test works
+# on rows with fresh ids, which are left behind.
+
+
+@pytest.fixture(scope="session")
+def engine():
+    try:
+        import create_db
+        from dbs_assignment.database import engine
+    except OperationalError as error:
+        pytest.skip(f"database is not reachable: {error}")
+
+    create_db.create_schema()
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    from dbs_assignment.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(engine):
+    # startup events are not run, so neither the cache listener nor the sweeper is started
+    from fastapi.testclient import TestClient
+    from dbs_assignment.__main__ import app
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def count_queries(engine):
+    # with count_queries() as statements: ... collects every statement sent on the engine
+    @contextlib.contextmanager
+    def counting():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return counting
+
+
+@pytest.fixture
+def make_publication(db):
+    # a publication with its own authors and a category, and copies available to rent
+    import dbs_assignment.models as models
+    from dbs_assignment import search
+
+    def make(authors: int = 1, copies: int = 0):
+        suffix = uuid.uuid4().hex[:8]
+        author_list = [models.Author(id=uuid.uuid4(), name=f"Author {number}", surname=suffix) for number in range(authors)]
+        categories = [models.Category(id=uuid.uuid4(), name=f"category-{suffix}")]
+        publication = models.Publication(
+            id=uuid.uuid4(), title=f"Title {suffix}", authors=author_list, categories=categories,
+            search_names=search.names(author_list, categories)
+        )
+        db.add(publication)
+        # instances have no relationship to their publication, so nothing orders their INSERTs after it
+        db.flush()
+        db.add_all(
+            models.Instance(id=uuid.uuid4(), type="physical", publisher="Test", year=2023, status="available", publication_id=publication.id)
+            for _ in range(copies)
+        )
+        db.commit()
+        return publication
+
+    return make
+
+
+@pytest.fixture
+def make_users(db):
+    import dbs_assignment.models as models
+
+    def make(count: int = 1) -> list:
+        ids = [uuid.uuid4() for _ in range(count)]
+        db.add_all(
+            models.User(id=id, name="Test", surname="User", email=f"{id}@example.com", birth_date="2000-01-01", personal_identificator=id.hex)
+            for id in ids
+        )
+        db.commit()
+        return ids
+
+    return make
@@ -0,0 +1,117 @@
+import time
+import uuid
+
+import pytest
+
+from dbs_assignment import cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # time.monotonic under the test's control, moved with clock[0] += seconds
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    backend = cache.MemoryBackend("test", maxsize=2, ttl=60)
+    backend.set(("id", 1), "one")
+    backend.set(("id", 2), "two")
+    # reading 1 makes 2 the least recently used
+    assert backend.get(("id", 1)) == "one"
+
+    backend.set(("id", 3), "three")
+
+    assert backend.get(("id", 2)) is None
+    assert backend.get(("id", 1)) == "one"
+    assert backend.get(("id", 3)) == "three"
+    assert backend.stats()["size"] == 2
+    assert backend.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    backend = cache.MemoryBackend("test", maxsize=10, ttl=5)
+    backend.set(("id", 1), "one")
+
+    clock[0] += 4
+    assert backend.get(("id", 1)) == "one"
+
+    clock[0] += 2
+    assert backend.get(("id", 1)) is None
+    assert backend.stats()["expirations"] == 1
+    assert backend.stats()["size"] == 0
+
+
+def test_counters():
+    backend = cache.MemoryBackend("test", maxsize=1, ttl=60)
+    backend.get(("id", 1))
+    backend.set(("id", 1), "one")
+    backend.get(("id", 1))
+    backend.get(("id", 1))
+    backend.set(("id", 2), "two")
+    backend.invalidate(("id", 2))
+    backend.get(("id", 2))
+
+    assert backend.stats() == {
+        "backend": "memory", "size": 0, "maxsize": 1,
+        "hits": 2, "misses": 2, "evictions": 1, "expirations": 0,
+    }
+
+
+@pytest.fixture
+def memory_caches(monkeypatch):
+    # fresh caches whatever CACHE_BACKEND is set to
+    for name in ("authors", "categories", "publications"):
+        monkeypatch.setattr(cache, name, cache.MemoryBackend(name, 100, 60))
+
+
+def add_author(client) -> dict:
+    response = client.post("/authors", json={"name": "Cached", "surname": uuid.uuid4().hex})
+    assert response.status_code == 201
+    return response.json()
+
+
+def add_category(client) -> dict:
+    response = client.post("/categories", json={"name": f"cached-{uuid.uuid4().hex}"})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_author_update_evicts_the_cached_author(memory_caches, client):
+    author = add_author(client)
+    id = uuid.UUID(author["id"])
+    assert client.get(f"/authors/{id}").status_code == 200
+    assert cache.authors.get(("id", id)) is not None
+
+    response = client.patch(f"/authors/{id}", json={"name": "Renamed"})
+    assert response.status_code == 200
+
+    assert cache.authors.get(("id", id)) is None
+    assert cache.authors.get(("name", "Cached", author["surname"])) is None
+    assert client.get(f"/authors/{id}").json()["name"] == "Renamed"
+
+
+def test_author_delete_evicts_the_cached_author(memory_caches, client):
+    id = uuid.UUID(add_author(client)["id"])
+    assert client.get(f"/authors/{id}").status_code == 200
+
+    assert client.delete(f"/authors/{id}").status_code == 204
+
+    assert cache.authors.get(("id", id)) is None
+    assert client.get(f"/authors/{id}").status_code == 404
+
+
+def test_category_update_and_delete_evict_the_cached_category(memory_caches, client):
+    category = add_category(client)
+    id = uuid.UUID(category["id"])
+    assert client.get(f"/categories/{id}").status_code == 200
+
+    assert client.patch(f"/categories/{id}", json={"name": f"renamed-{uuid.uuid4().hex}"}).status_code == 200
+    assert cache.categories.get(("id", id)) is None
+    assert cache.categories.get(("name", category["name"])) is None
+
+    assert client.get(f"/categories/{id}").status_code == 200
+    assert client.delete(f"/categories/{id}").status_code == 204
+    assert cache.categories.get(("id", id)) is None
+    assert client.get(f"/categories/{id}").status_code == 404
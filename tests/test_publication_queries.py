@@ -0,0 +1,18 @@
+from dbs_assignment import cache
+
+
+def get_publication_statements(client, count_queries, publication) -> list:
+    # a cache miss, so the publication is loaded from the database
+    cache.publications.invalidate(("id", publication.id))
+    with count_queries() as statements:
+        response = client.get(f"/publications/{publication.id}")
+
+    assert response.status_code == 200
+    return statements
+
+
+def test_get_publication_query_count_does_not_grow_with_authors(client, count_queries, make_publication):
+    one = get_publication_statements(client, count_queries, make_publication(authors=1))
+    many = get_publication_statements(client, count_queries, make_publication(authors=25))
+
+    assert len(many) == len(one)
@@ -0,0 +1,49 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+# The hot queries of the routers must be answerable from an index. They are EXPLAINed with
+# sequential scans disabled, so the planner picks an index whenever one fits, even on an
+# almost empty database. A plan that still contains a Seq Scan has no usable index.
+
+ID = f"'{uuid.uuid4()}'"
+CURSOR = f"('2023-01-01 00:00:00', {ID})"
+
+HOT_QUERIES = {
+    "available instances of a publication": f"SELECT id FROM instances WHERE publication_id = {ID} AND status = 'available'",
+    "reservation queue of a publication": f"SELECT user_id FROM reservations WHERE publication_id = {ID} ORDER BY position",
+    "rentals of a user, keyset page": f"SELECT * FROM rentals WHERE user_id = {ID} AND (created_at, id) > {CURSOR} ORDER BY created_at, id LIMIT 50",
+    "rentals of an instance": f"SELECT id FROM rentals WHERE publication_instance_id = {ID}",
+    "overdue rentals": "SELECT id FROM rentals WHERE status = 'active' AND end_date < current_date LIMIT 1000",
+    "expired holds": "SELECT id FROM reservations WHERE hold_expires_at < now() LIMIT 1000",
+    "cards of a user": f"SELECT * FROM cards WHERE user_id = {ID}",
+    "author by name": "SELECT * FROM authors WHERE (name, surname) IN (('Jane', 'Doe'), ('John', 'Smith'))",
+    "category by name": "SELECT * FROM categories WHERE name IN ('poetry', 'drama')",
+    "authors of a publication": f"SELECT author_id FROM publication_authors WHERE publication_id = {ID}",
+    "publications of an author": f"SELECT publication_id FROM publication_authors WHERE author_id = {ID}",
+    "categories of a publication": f"SELECT category_id FROM publication_categories WHERE publication_id = {ID}",
+    "instances keyset page": f"SELECT * FROM instances WHERE (created_at, id) > {CURSOR} ORDER BY created_at, id LIMIT 50",
+    "publication search": "SELECT id FROM publications WHERE search_vector @@ websearch_to_tsquery('simple', 'dune')",
+    "fuzzy publication search": "SELECT id FROM publications WHERE 'dnue' <% search_document",
+}
+
+
+def node_types(plan):
+    yield plan["Node Type"]
+    for child in plan.get("Plans", []):
+        yield from node_types(child)
+
+
+@pytest.mark.parametrize("query", HOT_QUERIES.values(), ids=HOT_QUERIES.keys())
+def test_hot_query_uses_an_index(engine, query):
+    with engine.connect() as connection:
+        connection.execute(text("SET enable_seqscan = off"))
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(node_types(plan[0]["Plan"]))
+
+    assert "Seq Scan" not in nodes, " > ".join(nodes)
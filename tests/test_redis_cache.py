@@ -0,0 +1,106 @@
+import datetime
+import fnmatch
+import json
+import uuid
+
+import pytest
+from fastapi import Response
+
+from dbs_assignment import cache
+
+
+class FakeRedis:
+    # the part of the redis client RedisBackend uses, values kept as bytes like the real one returns
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def scan_iter(self, match="*", count=None):
+        return [key for key in list(self.values) if fnmatch.fnmatchcase(key, match)]
+
+
+@pytest.fixture
+def redis_caches(monkeypatch):
+    # every cache of the module on one fake server, as the workers share one
+    client = FakeRedis()
+    for name in ("authors", "categories", "publications"):
+        monkeypatch.setattr(cache, name, cache.RedisBackend(name, 60, client=client))
+    return client
+
+
+def test_ids_and_times_survive_the_json_round_trip(redis_caches):
+    data = {
+        "id": uuid.uuid4(),
+        "name": "Round",
+        "created_at": datetime.datetime(2023, 4, 5, 6, 7, 8, 9, tzinfo=datetime.timezone.utc),
+        "birth_date": datetime.date(2000, 1, 2),
+        "nested": {"ids": [uuid.uuid4()]},
+    }
+    cache.authors.set(("id", data["id"]), data)
+
+    assert cache.authors.get(("id", data["id"])) == data
+    assert cache.authors.get(("id", uuid.uuid4())) is None
+    assert cache.authors.stats()["hits"] == 1 and cache.authors.stats()["misses"] == 1
+
+
+def test_stored_values_are_json(redis_caches):
+    id = uuid.uuid4()
+    cache.categories.set(("id", id), {"id": id, "name": "Json"})
+
+    stored = json.loads(redis_caches.get(cache.categories.redis_key(("id", id))))
+    assert stored == {"id": {"$uuid": str(id)}, "name": "Json"}
+
+
+def test_cached_etag_matches_the_fresh_one(redis_caches, db):
+    import dbs_assignment.models as models
+    from dbs_assignment import etag
+
+    author = models.Author(id=uuid.uuid4(), name="Etag", surname=uuid.uuid4().hex)
+    db.add(author)
+    db.commit()
+    cache.cache_author(author)
+
+    cached, fresh = Response(), Response()
+    etag.tag(cached, models.Author, cache.authors.get(("id", author.id)))
+    etag.tag(fresh, models.Author, author)
+
+    assert cached.headers["ETag"] == fresh.headers["ETag"]
+    assert cached.headers["ETag"] == etag.current(db, models.Author, author.id, "Author not found")
+
+
+def test_notification_evicts_the_matching_keys(redis_caches, engine):
+    from dbs_assignment import invalidation
+
+    author = {"id": uuid.uuid4(), "name": "Notified", "surname": "Author"}
+    other = {"id": uuid.uuid4(), "name": "Other", "surname": "Author"}
+    for data in (author, other):
+        cache.authors.set(("id", data["id"]), data)
+        cache.authors.set(("name", data["name"], data["surname"]), data)
+    category = {"id": uuid.uuid4(), "name": "notified"}
+    cache.categories.set(("id", category["id"]), category)
+    cache.categories.set(("name", category["name"]), category)
+    publication = uuid.uuid4()
+    cache.publications.set(("id", publication), {"id": publication})
+
+    invalidation.apply(json.dumps({"table": "authors", "row": {**author, "id": str(author["id"])}}))
+
+    assert cache.authors.get(("id", author["id"])) is None
+    assert cache.authors.get(("name", "Notified", "Author")) is None
+    assert cache.authors.get(("id", other["id"])) == other
+    # publications embed author names
+    assert cache.publications.get(("id", publication)) is None
+
+    invalidation.apply(json.dumps({"table": "categories", "row": {**category, "id": str(category["id"])}}))
+
+    assert cache.categories.get(("id", category["id"])) is None
+    assert cache.categories.get(("name", "notified")) is None
+    assert cache.authors.get(("name", "Other", "Author")) == other
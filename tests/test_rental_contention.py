@@ -0,0 +1,33 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+import dbs_assignment.models as models
+
+COPIES = 20
+REQUESTS = 400
+# more than the connection pool holds, requests also queue for connections like under real load
+CONCURRENCY = 200
+
+
+def test_concurrent_rentals_never_share_a_copy(db, client, make_publication, make_users):
+    publication = make_publication(copies=COPIES)
+    user_ids = make_users(REQUESTS)
+
+    def rent(user_id):
+        body = {"user_id": str(user_id), "publication_id": str(publication.id), "duration": 7}
+        return client.post("/rentals", json=body).status_code
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        statuses = Counter(pool.map(rent, user_ids))
+
+    allocated = Counter(db.scalars(
+        select(models.Rental.publication_instance_id)
+        .join(models.Instance, models.Instance.id == models.Rental.publication_instance_id)
+        .where(models.Instance.publication_id == publication.id)
+    ))
+
+    assert [instance_id for instance_id, count in allocated.items() if count > 1] == []
+    assert sum(allocated.values()) == COPIES
+    assert statuses[201] == COPIES
@@ -0,0 +1,33 @@
+import time
+import uuid
+
+import dbs_assignment.models as models
+
+
+def add_author(db) -> models.Author:
+    author = models.Author(id=uuid.uuid4(), name="Timestamp", surname=uuid.uuid4().hex)
+    db.add(author)
+    db.commit()
+    return author
+
+
+def test_timestamps_come_from_the_database_at_insert_time(db):
+    first = add_author(db)
+    time.sleep(0.05)
+    second = add_author(db)
+
+    # fetched with RETURNING, the objects were not refreshed
+    assert first.created_at is not None and first.updated_at is not None
+    assert second.created_at > first.created_at
+
+
+def test_updated_at_moves_on_update(db):
+    author = add_author(db)
+    created_at = author.created_at
+    time.sleep(0.05)
+
+    author.name = "Renamed"
+    db.commit()
+
+    assert author.created_at == created_at
+    assert author.updated_at > created_at